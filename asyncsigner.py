@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+
+import time
+import asyncio
+from common import percentile
+from bdstraversal_mt_c_like import MTBDSState
+
+
+class AsyncSigner(object):
+    """Hands out the auth paths of a BDSState or MTBDSState, and moves the
+    traversal step that prepares the next leaf to a background executor.
+
+    At most one step is pending at any time: a request first waits for the
+    previous step to finish. This keeps every step within its budget of
+    (H - K) >> 1 updates, no matter how quickly the requests arrive. If a
+    step raises, the state is no longer valid, and every later request
+    raises the same error."""
+
+    def __init__(self, state, leaf=0, executor=None):
+        self.state = state
+        self.leaf = leaf
+        self.executor = executor
+        self.pending = None
+        self.lock = None  # made in the running loop, see acquire
+        self.latencies = []
+        if isinstance(state, MTBDSState):
+            self.leaves = 1 << (state.D * state.H)
+            self.step = state.traverse
+        else:
+            self.leaves = 1 << state.H
+            self.step = state.traverse_and_update
+
+    def authpath(self):
+        if isinstance(self.state, MTBDSState):
+            return [list(auth) for auth in self.state.authpaths()]
+        return list(self.state.auth)
+
+    def acquire(self):
+        # before Python 3.10, a lock belongs to the event loop that is
+        # current when it is made, which is not always the running one
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        return self.lock
+
+    async def sign(self):
+        """Returns the next leaf index and its auth path(s)."""
+        start = time.perf_counter()
+        async with self.acquire():
+            if self.pending is not None:
+                await self.pending
+            leaf = self.leaf
+            if leaf >= self.leaves:
+                raise ValueError("All leaves have been used")
+            path = self.authpath()
+            self.leaf += 1
+            if self.leaf < self.leaves:
+                loop = asyncio.get_running_loop()
+                self.pending = loop.run_in_executor(self.executor, self.step,
+                                                    leaf)
+        self.latencies.append(time.perf_counter() - start)
+        return leaf, path
+
+    async def close(self):
+        """Waits for the pending step, if any."""
+        async with self.acquire():
+            if self.pending is not None:
+                await self.pending
+
+    def stats(self):
+        """Returns the number of signatures and the latency percentiles,
+        which are None before the first signature."""
+        return {'signatures': len(self.latencies),
+                'p50': percentile(self.latencies, 50),
+                'p99': percentile(self.latencies, 99)}
+
+
+async def run(signer, count, interval):
+    """Issues count signing requests, one every interval seconds."""
+    for _ in range(count):
+        await signer.sign()
+        await asyncio.sleep(interval)
+    await signer.close()
+
+
+if __name__ == "__main__":
+    state = MTBDSState()
+    state.keygen_and_setup()
+    latencies = []
+    for s in range(1000):
+        start = time.perf_counter()
+        [list(auth) for auth in state.authpaths()]
+        state.traverse(s)
+        latencies.append(time.perf_counter() - start)
+    print('inline: p50 {:.1f}us, p99 {:.1f}us'.format(
+        percentile(latencies, 50) * 1e6, percentile(latencies, 99) * 1e6))
+    state = MTBDSState()
+    state.keygen_and_setup()
+    signer = AsyncSigner(state)
+    asyncio.run(run(signer, 1000, 0.0005))
+    stats = signer.stats()
+    print('async: p50 {:.1f}us, p99 {:.1f}us'.format(
+        stats['p50'] * 1e6, stats['p99'] * 1e6))
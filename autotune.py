@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+
+import time
+from collections import namedtuple
+import common
+from common import leafcalc, g
+from bdstraversal_mt_c_like import BDSState, MTBDSState
+
+Plan = namedtuple('Plan', ['H', 'K', 'D', 'memory', 'hashes', 'keygen'])
+
+
+def tree_nodes(H, K):
+    """Returns the most nodes a BDSState holds: AUTH, KEEP, RETAIN, the
+    treehash nodes and their part of the stack."""
+    return H + H // 2 + (1 << K) - K - 1 + 2 * (H - K)
+
+
+def step_cost(H, K, D, leaf_cost=1):
+    """Returns the most hashes a traversal step takes, counting a leaf as
+    leaf_cost hashes. For one tree, this is the bound of Buchmann, Dahmen and
+    Szydlo: (H-K)/2 + 1 leaves and 3(H-K-1)/2 + 1 inner nodes. With more
+    layers, the next tree of the lowest layer takes an extra leaf, and every
+    update may merge up to H nodes."""
+    if D == 1:
+        leaves = (H - K) // 2 + 1
+        nodes = max(1, 3 * (H - K - 1) // 2 + 1)
+    else:
+        leaves = (H - K) // 2 + 2
+        nodes = 1 + ((H - K) // 2 + 1) * H
+    return leaves * leaf_cost + nodes
+
+
+def configurations(signatures):
+    """Yields the valid (H, K, D) with room for at least signatures leaves."""
+    bits = max(1, (signatures - 1).bit_length())
+    for D in range(1, bits + 1):
+        H0 = -(-bits // D)
+        for H in (H0, H0 + 1):
+            for K in range(2 + H % 2, H + 1, 2):
+                if D == 1 or (H - K) // 2 >= D - 1:
+                    yield H, K, D
+
+
+def calibrate(seconds=0.1):
+    """Measures how many node hashes per second this machine computes."""
+    v = leafcalc(0) * 2
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(1000):
+            g(v)
+        count += 1000
+    return count / (time.perf_counter() - start)
+
+
+def plan(signatures, memory, hashes=None, latency=None, leaf_cost=1,
+         node_bytes=None, rate=None):
+    """Picks the (H, K, D) for at least signatures leaves that fits a memory
+    budget in bytes and a budget of hashes per signature, or of seconds per
+    signature given latency, calibrated to this machine unless a rate is
+    passed. Of the configurations that fit, the one with the cheapest keygen
+    is chosen, then the fewest hashes per step, then the least memory."""
+    if hashes is None and latency is None:
+        raise ValueError("Either a hash or a latency budget is needed")
+    if hashes is None:
+        hashes = latency * (rate or calibrate())
+    node_bytes = node_bytes or common.N + 1  # a value and a height
+    best = None
+    for H, K, D in configurations(signatures):
+        trees = 1 if D == 1 else 2 * D  # the current and the next trees
+        size = trees * tree_nodes(H, K) * node_bytes
+        cost = step_cost(H, K, D, leaf_cost)
+        keygen = D * (1 << H) * (leaf_cost + 1)
+        if size <= memory and cost <= hashes:
+            candidate = Plan(H, K, D, size, cost, keygen)
+            if best is None or (candidate.keygen, candidate.hashes,
+                                candidate.memory) < (best.keygen, best.hashes,
+                                                     best.memory):
+                best = candidate
+    if best is None:
+        raise ValueError("No configuration fits the budgets")
+    return best
+
+
+def build(plan, hasher=common):
+    """Returns a BDSState or MTBDSState for the plan, not yet set up."""
+    if plan.D == 1:
+        return BDSState(plan.H, plan.K, hasher)
+    return MTBDSState(plan.H, plan.K, plan.D, hasher)
+
+
+if __name__ == "__main__":
+    rate = calibrate()
+    print('{:.0f} hashes per second'.format(rate))
+    for signatures in [2 ** 10, 2 ** 20, 2 ** 40]:
+        for memory in [2 ** 10, 2 ** 13, 2 ** 16]:
+            for latency in [1e-5, 1e-4]:
+                try:
+                    p = plan(signatures, memory, latency=latency, rate=rate)
+                    result = ('H={}, K={}, D={}: {} bytes, {} hashes per step,'
+                              ' {} keygen hashes'.format(*p))
+                except ValueError as e:
+                    result = str(e)
+                print('2^{} signatures, {} bytes, {}s: {}'.format(
+                    signatures.bit_length() - 1, memory, latency, result))
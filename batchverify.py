@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+
+import time
+from multiprocessing import Pool, cpu_count
+import common
+from common import (leafcalc, g, compute_root, read_path, CostCounter,
+                    TopCache)
+from bdstraversal_c_like import BDSState
+
+
+def verify_chunk(args):
+    """Computes the roots for a list of (idx, authpath) items one level at a
+    time. Items for neighbouring leaves share their upper auth nodes, so
+    identical inputs are only hashed once per level."""
+    H, root, items = args
+    leaves = dict.fromkeys(idx for idx, path in items)
+    for idx in leaves:
+        leaves[idx] = leafcalc(idx)
+    values = [leaves[idx] for idx, path in items]
+    for h in range(H):
+        inputs = []
+        for (idx, path), v in zip(items, values):
+            if (idx >> h) & 1:
+                inputs.append(path[h].v + v)
+            else:
+                inputs.append(v + path[h].v)
+        hashes = dict.fromkeys(inputs)
+        for v in hashes:
+            hashes[v] = g(v)
+        values = [hashes[v] for v in inputs]
+    return [v == root for v in values]
+
+
+def verify_batch(H, root, items, processes=1, chunks=None):
+    """Verifies many (idx, authpath) items against root, returning a list of
+    booleans. With more than one process, the items are split into chunks of
+    consecutive items, which are verified in a process pool."""
+    items = list(items)
+    if not items:
+        return []
+    if processes == 1:
+        return verify_chunk((H, root, items))
+    chunks = chunks or (processes or cpu_count()) * 4
+    size = max(1, -(-len(items) // chunks))
+    jobs = [(H, root, items[i:i + size]) for i in range(0, len(items), size)]
+    with Pool(processes, **common.pool_options()) as pool:
+        results = pool.map(verify_chunk, jobs)
+    return [ok for result in results for ok in result]
+
+
+if __name__ == "__main__":
+    H, K = 10, 4
+    state = BDSState(H, K)
+    root = state.keygen_and_setup().v
+    buf = b''.join(node.v for node in state.auth)
+    buf += state.traverse_range(0, (1 << H) - 1)
+    items = [(s, read_path(buf, H, s)) for s in range(1 << H)]
+    start = time.time()
+    assert all(compute_root(H, idx, path) == root for idx, path in items)
+    single = time.time() - start
+    print('compute_root: {:.0f} paths/s'.format(len(items) / single))
+    for batch in (16, 128, 1 << H):
+        start = time.time()
+        for i in range(0, len(items), batch):
+            assert all(verify_batch(H, root, items[i:i + batch]))
+        print('batches of {}: {:.0f} paths/s'.format(
+            batch, len(items) / (time.time() - start)))
+    for depth in range(0, H + 1, 2):
+        cache = TopCache(H, depth)
+        cache.add(H, 0, root)
+        counter = CostCounter()
+        for idx, path in items:
+            assert compute_root(H, idx, path, cache, counter) == root
+        print('cache depth {}: {:.2f} hashes per path, {} nodes cached'.format(
+            depth, (counter.leaves + counter.nodes) / len(items),
+            len(cache.nodes)))
+    for processes in range(2, cpu_count() + 1):
+        start = time.time()
+        assert all(verify_batch(H, root, items, processes))
+        print('{} processes: {:.0f} paths/s'.format(
+            processes, len(items) / (time.time() - start)))
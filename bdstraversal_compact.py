@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+
+import common
+from common import (NodeStore, LowIndex, recursive_hash, compute_root,
+                    state_size)
+import bdstraversal_mt_c_like
+from bdstraversal_mt_c_like import H, K
+
+
+class Treehash(object):
+
+    def __init__(self, h, state, startidx=0, completed=False):
+        self.next_idx = startidx
+        self.completed = completed
+        self.h = h
+        self.state = state
+        self.stackusage = 0  # if we would not keep track, nodes would be mixed
+        state.index.set(h, None if completed else h)
+
+    def restart(self, startidx):
+        self.__init__(h=self.h, state=self.state, startidx=startidx)
+
+    def update(self):
+        """Performs one iteration of Treehash, i.e. adds one leaf node.
+        The leaf is placed directly above the shared stack, so that it can be
+        merged with the nodes below it in place."""
+        state = self.state
+        store = state.store
+        top = state.stackslot + state.stacksize
+        store.set(top, 0, state.hasher.leafcalc(self.next_idx))
+        while (self.stackusage > 0 and
+               store.heights[top - 1] == store.heights[top]):
+            v = state.hasher.g(store.get(top - 1, 2))
+            store.set(top - 1, store.heights[top] + 1, v)
+            top -= 1
+            self.stackusage -= 1
+        state.stacksize = top - state.stackslot + 1
+        self.stackusage += 1
+        self.next_idx += 1
+        if self.stackusage == 1 and store.heights[top] == self.h:
+            self.completed = True
+            store.copy(state.treehashslot + self.h, top)
+            state.stacksize -= 1
+            self.stackusage -= 1
+        # the node on top is the lowest of the nodes of this instance
+        state.index.set(self.h, None if self.completed else store.heights[top])
+
+
+class BDSState(object):
+    """BDS traversal state that keeps all nodes in a single NodeStore, rather
+    than as separate Node objects."""
+
+    def __init__(self, H=H, K=K, hasher=common):
+        assert K >= 2 and (H - K) % 2 == 0
+        self.H = H
+        self.K = K
+        self.hasher = hasher
+        # the auth nodes take the first H slots, followed by the other nodes;
+        # the shared stack needs room for H nodes during keygen, plus one for
+        # the node that is being merged into it
+        self.keepslot = H
+        self.retainslot = self.keepslot + (H // 2)
+        self.treehashslot = self.retainslot + (1 << K) - K - 1
+        self.stackslot = self.treehashslot + H - K
+        self.store = NodeStore(self.stackslot + H + 1)
+        self.stacksize = 0
+        self.nextidx = 0
+        self.index = LowIndex(H - K)
+        self.treehash = [Treehash(h, self, completed=True)
+                         for h in range(H - K)]
+
+    @property
+    def auth(self):
+        return [self.store.node(h) for h in range(self.H)]
+
+    def stack_update(self, idx):
+        H, K = self.H, self.K
+        store = self.store
+        top = self.stackslot + self.stacksize
+        store.set(top, 0, self.hasher.leafcalc(idx))
+        if H - K > 0 and idx == 3:
+            store.copy(self.treehashslot, top)
+        while (self.stacksize > 0 and
+               store.heights[top - 1] == store.heights[top]):
+            h = store.heights[top]
+            if idx >> h == 1:
+                store.copy(h, top)
+            else:  # the node is a right-node with row-index 2idx + 3
+                if h < H - K and idx >> h == 3:
+                    store.copy(self.treehashslot + h, top)
+                elif h >= H - K:
+                    offset = (1 << (H - 1 - h)) + h - H
+                    rowidx = ((idx >> h) - 3) >> 1
+                    store.copy(self.retainslot + offset + rowidx, top)
+            store.set(top - 1, h + 1, self.hasher.g(store.get(top - 1, 2)))
+            top -= 1
+            self.stacksize -= 1
+        self.stacksize += 1
+
+    def keygen_and_setup(self):
+        """Sets up the state for the start of BDS traversal."""
+        for j in range(1 << self.H):
+            self.stack_update(j)
+        self.hasher.step(keygen=True)
+        self.stacksize = 0
+        return self.store.node(self.stackslot)
+
+    def advance(self, s):
+        """Moves the auth nodes in the store to those for leaf s + 1."""
+        H, K = self.H, self.K
+        store = self.store
+        KEEP, RETAIN = self.keepslot, self.retainslot
+        for h in range(H):
+            if not ((s >> h) & 1):
+                tau = h
+                break
+        if tau > 0:  # compute this before KEEP[(tau - 1) >> 1] is overwritten
+            v = self.hasher.g(bytes(store.get(tau - 1)) +
+                              store.get(KEEP + ((tau - 1) >> 1)))
+
+        if not ((s >> (tau+1)) & 1) and tau < H - 1:
+            store.copy(KEEP + (tau >> 1), tau)
+
+        if tau == 0:
+            store.set(0, 0, self.hasher.leafcalc(s))
+
+        else:
+            store.set(tau, tau, v)
+            for h in range(tau):
+                if h < H - K:
+                    store.copy(h, self.treehashslot + h)
+                else:
+                    offset = (1 << (H - 1 - h)) + h - H
+                    rowidx = ((s >> h) - 1) >> 1
+                    store.copy(h, RETAIN + offset + rowidx)
+            for h in range(tau if (tau < H - K) else H - K):
+                startidx = s + 1 + 3 * (1 << h)
+                if startidx < 1 << H:
+                    self.treehash[h].restart(startidx)
+
+    def traverse(self, s):
+        """Returns the auth nodes for leaf s + 1."""
+        self.advance(s)
+        return self.auth
+
+    def update(self, n):
+        for _ in range(n):
+            h = self.index.lowest()
+            if h is None:
+                break
+            self.treehash[h].update()
+            n -= 1
+        return n
+
+    def traverse_and_update(self, s):
+        auth = self.traverse(s)
+        self.update((self.H - self.K) >> 1)
+        self.hasher.step()
+        return auth
+
+    def traverse_range(self, s, n, buf=None):
+        """Writes the auth paths for leaves s + 1, ..., s + n to buf, copying
+        them straight from the AUTH slots of the store."""
+        size = self.H * self.store.n
+        buf = bytearray(n * size) if buf is None else buf
+        for i in range(n):
+            self.advance(s + i)
+            self.update((self.H - self.K) >> 1)
+            self.hasher.step()
+            buf[i * size:(i + 1) * size] = self.store.get(0, self.H)
+        return buf
+
+
+if __name__ == "__main__":
+    correct_root = recursive_hash(H)
+    state = BDSState()
+    print('root: {}'.format(state.keygen_and_setup().v == correct_root))
+    for s in range((1 << H) - 1):
+        root = compute_root(H, s + 1, state.traverse_and_update(s))
+        assert root == correct_root
+    print('BDSState: {} bytes per state'.format(
+        state_size(bdstraversal_mt_c_like.BDSState)))
+    print('compact BDSState: {} bytes per state'.format(state_size(BDSState)))
@@ -1,6 +1,8 @@
 #! /usr/bin/env python
 
-from common import Node, leafcalc, g, recursive_hash, compute_root, end_of_tree
+import common
+from common import (Node, LowIndex, recursive_hash, compute_root, end_of_tree,
+                    write_paths)
 
 H = 4  # this is the height of the subtrees
 K = 2
@@ -12,26 +14,32 @@ if (H - K) / 2 < D - 1:
 
 class Treehash(object):
 
-    def __init__(self, h, stack, startidx=0, completed=False):
+    def __init__(self, h, stack, startidx=0, completed=False, hasher=common,
+                 index=None):
         self.next_idx = startidx
         self.node = None
         self.completed = completed
         self.h = h
         self.stack = stack
+        self.hasher = hasher
+        self.index = index  # a common.LowIndex shared by the instances
         self.stackusage = 0  # if we would not keep track, nodes would be mixed
+        if index is not None:
+            index.set(h, None if completed else h)
 
     def restart(self, startidx):
-        self.__init__(h=self.h, stack=self.stack, startidx=startidx)
+        self.__init__(h=self.h, stack=self.stack, startidx=startidx,
+                      hasher=self.hasher, index=self.index)
 
     def update(self):
         """Performs one iteration of Treehash, i.e. adds one leaf node.
         Note that this is different from Treehash.update() in the classic
         traversal algorithm, where only one computational unit is performed."""
-        node1 = Node(h=0, v=leafcalc(self.next_idx))
+        node1 = Node(h=0, v=self.hasher.leafcalc(self.next_idx))
         while self.stackusage > 0 and self.stack[-1].h == node1.h:
             node2 = self.stack.pop()
             self.stackusage -= 1
-            node1 = Node(h=node1.h+1, v=g(node2.v + node1.v))
+            node1 = Node(h=node1.h+1, v=self.hasher.g(node2.v + node1.v))
         self.stack.append(node1)
         self.stackusage += 1
         self.next_idx += 1
@@ -39,9 +47,11 @@ class Treehash(object):
             self.completed = True
             self.node = self.stack.pop()
             self.stackusage -= 1
+        if self.index is not None:  # node1 is the lowest of its nodes
+            self.index.set(self.h, None if self.completed else node1.h)
 
     def height(self):
-        r = H
+        r = self.h
         for node in self.stack[-self.stackusage:]:
             if node.h < r:
                 r = node.h
@@ -50,18 +60,33 @@ class Treehash(object):
 
 class BDSState(object):
 
-    def __init__(self):
+    def __init__(self, H=H, K=K, hasher=common, cache=None):
+        assert K >= 2 and (H - K) % 2 == 0
+        self.H = H
+        self.K = K
+        self.hasher = hasher
+        self.cache = cache  # a common.TopCache, filled in keygen, for seek
         self.stack = []
         self.auth = [None] * H
         self.keep = [None] * (H // 2)
         self.treehash = [None] * (H - K)
         self.retain = [None] * ((1 << K) - K - 1)
         self.nextidx = 0
+        self.index = LowIndex(H - K)
         for h in range(H - K):
-            self.treehash[h] = Treehash(h, self.stack, completed=True)
+            self.treehash[h] = Treehash(h, self.stack, completed=True,
+                                        hasher=hasher, index=self.index)
 
-    def stack_update(self, idx):
-        node1 = Node(h=0, v=leafcalc(idx))
+    def stack_update(self, idx, leaf=None):
+        """Adds leaf idx to the stack, merging it with the nodes below it and
+        keeping the nodes the state needs. The leaf value can be passed in,
+        e.g. when leaves come from an external source."""
+        H, K = self.H, self.K
+        if leaf is None:
+            leaf = self.hasher.leafcalc(idx)
+        node1 = Node(h=0, v=leaf)
+        if self.cache is not None:
+            self.cache.add(0, idx, node1.v)
         if node1.h < H - K and idx == 3:
             self.treehash[0].node = node1
         while self.stack and self.stack[-1].h == node1.h:
@@ -75,17 +100,21 @@ class BDSState(object):
                     rowidx = ((idx >> node1.h) - 3) >> 1
                     self.retain[offset + rowidx] = node1
             node2 = self.stack.pop()
-            node1 = Node(h=node1.h + 1, v=g(node2.v + node1.v))
+            node1 = Node(h=node1.h + 1, v=self.hasher.g(node2.v + node1.v))
+            if self.cache is not None:
+                self.cache.add(node1.h, idx >> node1.h, node1.v)
         self.stack.append(node1)
 
     def keygen_and_setup(self):
         """Sets up the state for the start of BDS traversal."""
-        for j in range(1 << H):
+        for j in range(1 << self.H):
             self.stack_update(j)
+        self.hasher.step(keygen=True)
         return self.stack.pop()
 
     def traverse(self, s):
         """Returns the auth nodes for leaf s + 1."""
+        H, K = self.H, self.K
         for h in range(H):
             if not ((s >> h) & 1):
                 tau = h
@@ -97,10 +126,11 @@ class BDSState(object):
             self.keep[tau >> 1] = self.auth[tau]
 
         if tau == 0:
-            self.auth[0] = Node(h=0, v=leafcalc(s))
+            self.auth[0] = Node(h=0, v=self.hasher.leafcalc(s))
 
         else:
-            self.auth[tau] = Node(h=0, v=g(self.auth[tau - 1].v + tempkeep.v))
+            self.auth[tau] = Node(h=tau, v=self.hasher.g(self.auth[tau - 1].v +
+                                                         tempkeep.v))
             for h in range(tau):
                 if h < H - K:
                     self.auth[h] = self.treehash[h].node
@@ -116,35 +146,122 @@ class BDSState(object):
 
     def update(self, n):
         for _ in range(n):
-            l_min = H
-            h = H - K
-            for j in range(H - K):
-                if self.treehash[j].completed:
-                    low = H
-                elif self.treehash[j].stackusage == 0:
-                    low = j
-                else:
-                    low = self.treehash[j].height()
-                if low < l_min:
-                    h = j
-                    l_min = low
-            if h == H - K:
+            h = self.index.lowest()
+            if h is None:
                 break
             self.treehash[h].update()
             n -= 1
         return n
 
+    def node(self, h, i):
+        """Returns node i at height h from RETAIN or the cache if it is there,
+        or else computes it from its 2^h leaves."""
+        H, K = self.H, self.K
+        if H - K <= h < H - 1 and i >= 3 and i & 1:
+            offset = (1 << (H - 1 - h)) + h - H
+            return self.retain[offset + ((i - 3) >> 1)]
+        if self.cache is not None and h >= H - self.cache.depth:
+            v = self.cache.get(h, i)
+            if v is not None:
+                return Node(h=h, v=v)
+        stack = []
+        for j in range(i << h, (i + 1) << h):
+            node1 = Node(h=0, v=self.hasher.leafcalc(j))
+            while stack and stack[-1].h == node1.h:
+                node2 = stack.pop()
+                node1 = Node(h=node1.h + 1, v=self.hasher.g(node2.v + node1.v))
+            stack.append(node1)
+        return stack.pop()
+
+    def seek(self, s):
+        """Moves a state that has been set up to leaf s, as if it had been
+        traversed up to s. Rather than replaying s steps, it rebuilds the
+        state right after the last step s0 at which all treehash instances
+        were restarted, and replays the fewer than 2^(H-K) steps since.
+        The top nodes are taken from RETAIN and the cache; without a cache,
+        left nodes at heights H-K and up are computed from their leaves."""
+        H, K = self.H, self.K
+        s0 = ((s >> (H - K)) << (H - K)) - 1  # -1 stands for keygen
+        del self.stack[:]
+        for h in range(H):
+            self.auth[h] = self.node(h, ((s0 + 1) >> h) ^ 1)
+        for m in range(len(self.keep)):
+            self.keep[m] = None
+            last = -1
+            for h in range(2 * m, min(2 * m + 2, H - 1)):
+                # KEEP is written when bits 0..h-1 of s are set, and bits h
+                # and h+1 are not; find the last such step up to s0
+                low = (1 << h) - 1
+                if s0 >= low:
+                    written = ((s0 - low) >> (h + 2) << (h + 2)) + low
+                    if written > last:
+                        last = written
+                        self.keep[m] = self.node(h, (written >> h) | 1)
+        for h in range(H - K):
+            # the last restart at a step k * 2^(h+1) - 1 that was in range
+            k = min((s0 + 1) >> (h + 1),
+                    ((1 << H) - 3 * (1 << h) - 1) >> (h + 1))
+            startidx = (k << (h + 1)) + 3 * (1 << h)
+            if k <= 0:
+                th = Treehash(h, self.stack, completed=True,
+                              hasher=self.hasher, index=self.index)
+                th.node = self.node(h, 3)
+            elif (k << (h + 1)) - 1 == s0:
+                th = Treehash(h, self.stack, startidx, hasher=self.hasher,
+                              index=self.index)
+            else:
+                th = Treehash(h, self.stack, startidx + (1 << h), True,
+                              self.hasher, self.index)
+                th.node = self.node(h, startidx >> h)
+            self.treehash[h] = th
+        if s0 >= 0:
+            self.update((H - K) >> 1)
+        for t in range(s0 + 1, s):
+            self.traverse(t)
+            self.update((H - K) >> 1)
+        self.hasher.step(keygen=True)
+
     def traverse_and_update(self, s):
         auth = self.traverse(s)
-        self.update((H - K) >> 1)
+        self.update((self.H - self.K) >> 1)
+        self.hasher.step()
         return auth
 
+    def traverse_range(self, s, n, buf=None):
+        """Writes the auth paths for leaves s + 1, ..., s + n to buf."""
+        return write_paths(self.traverse_and_update, self.H, s, n, buf)
+
+
+def upcoming(state, s, steps):
+    """Returns the leaves that traverse_and_update(s), ..., (s + steps - 1)
+    will compute: the rest of the running treehash instances, those of the
+    instances that these steps restart, and the leaves for AUTH[0]."""
+    H, K = state.H, state.K
+    leaves = set()
+    for th in state.treehash:
+        if not th.completed:
+            leaves.update(range(th.next_idx, ((th.next_idx >> th.h) + 1)
+                                << th.h))
+    for t in range(s, min(s + steps, (1 << H) - 1)):
+        if not t & 1:
+            leaves.add(t)
+        for h in range(H - K):
+            if (t + 1) & ((1 << (h + 1)) - 1) == 0:
+                startidx = t + 1 + 3 * (1 << h)
+                if startidx < 1 << H:
+                    leaves.update(range(startidx, startidx + (1 << h)))
+    return sorted(leaves)
+
 
 class MTBDSState(object):
 
-    def __init__(self):
-        self.currstates = [BDSState() for _ in range(D)]
-        self.nextstates = [BDSState() for _ in range(D)]
+    def __init__(self, H=H, K=K, D=D, hasher=common):
+        self.H = H
+        self.K = K
+        self.D = D
+        self.hasher = hasher
+        self.currstates = [BDSState(H, K, hasher) for _ in range(D)]
+        self.nextstates = [BDSState(H, K, hasher) for _ in range(D)]
 
     def keygen_and_setup(self):
         for state in self.currstates:
@@ -154,7 +271,45 @@ class MTBDSState(object):
     def authpaths(self):
         return [state.auth for state in self.currstates]
 
+    def seek(self, s):
+        """Moves the states to leaf s, by seeking every current tree to its
+        own leaf, and building the next tree of each layer up to one leaf
+        per step since the layer last swapped trees. The auth paths are the
+        same as after stepping to s, from s on; the state is not.
+
+        For the lowest layer, both trees are exactly where traverse would
+        have them. The higher layers only get what the lower layers leave
+        over of the budget, which depends on every step before s, so seek
+        does not replay it: their current trees get the treehash updates of
+        a BDSState on its own, and their next trees are ahead. That is safe
+        as long as traverse is: a next tree is only used once it is complete
+        and never grows past 2^H leaves, and a current tree gets the leftover
+        budget on top of the schedule that BDS completes in time."""
+        H, K = self.H, self.K
+        for i in range(self.D):
+            self.seek_current(i, s)
+            nxt = BDSState(H, K, self.hasher)
+            while nxt.nextidx < min(1 << H, s & ((1 << (H*(i+1))) - 1)):
+                nxt.stack_update(nxt.nextidx)
+                nxt.nextidx += 1
+            self.nextstates[i] = nxt
+        self.hasher.step(keygen=True)
+
+    def seek_current(self, i, s):
+        """Moves the current tree of layer i to its leaf for leaf s. A tree
+        that traverse swapped in still has the leaves of its build and its
+        root on the stack."""
+        H = self.H
+        curr = self.currstates[i]
+        leaf = (s >> (H*i)) & ((1 << H) - 1)
+        curr.seek(leaf)
+        if s >> (H*(i+1)):  # swapped in by traverse
+            curr.nextidx = 1 << H
+            curr.stack.insert(0, Node(h=H, v=compute_root(
+                H, leaf, curr.auth, hasher=self.hasher)))
+
     def traverse(self, s):
+        H, K, D = self.H, self.K, self.D
         needswap_upto = -1
         updates = H - K >> 1
         self.nextstates[0].stack_update(self.nextstates[0].nextidx)
@@ -172,5 +327,6 @@ class MTBDSState(object):
             else:
                 needswap_upto = i
                 self.currstates[i] = self.nextstates[i]
-                self.nextstates[i] = BDSState()
+                self.nextstates[i] = BDSState(H, K, self.hasher)
                 updates -= 1  # a scheme like XMSS^MT would spend 1 to link
+        self.hasher.step()
@@ -0,0 +1,131 @@
+#! /usr/bin/env python
+
+import sys
+import json
+import time
+import subprocess
+import tracemalloc
+import common
+from common import CostCounter, state_size, percentile
+from classictraversal import ClassicState
+from logtraversal import LogState
+import bdstraversal
+import bdstraversal_c_like
+import bdstraversal_mt_c_like
+import bdstraversal_compact
+from fractaltraversal import FractalState
+
+ENGINES = [
+    ('classic', lambda H, K, D, hasher: ClassicState(H, hasher)),
+    ('log', lambda H, K, D, hasher: LogState(H, hasher)),
+    ('bds', lambda H, K, D, hasher: bdstraversal.BDSState(H, K, hasher)),
+    ('bds_c_like', lambda H, K, D, hasher:
+        bdstraversal_c_like.BDSState(H, K, hasher)),
+    ('BDSState', lambda H, K, D, hasher:
+        bdstraversal_mt_c_like.BDSState(H, K, hasher)),
+    ('compact BDSState', lambda H, K, D, hasher:
+        bdstraversal_compact.BDSState(H, K, hasher)),
+    ('fractal', lambda H, K, D, hasher: FractalState(H, 2, hasher)),
+]
+MT_ENGINE = ('MTBDSState', lambda H, K, D, hasher:
+             bdstraversal_mt_c_like.MTBDSState(H, K, D, hasher))
+GRID = [(6, 2), (8, 2), (8, 4), (10, 4)]
+MT_GRID = [(4, 2, 2), (4, 2, 3), (6, 2, 2)]
+SIZE_INSTANCES = 20
+
+
+def steps(state, H, D):
+    """Returns the traversal step function and the number of steps to take
+    through all leaves."""
+    step = getattr(state, 'traverse_and_update', state.traverse)
+    return step, (1 << (H * D)) - 1
+
+
+def run(factory, H, K, D):
+    """Benchmarks one engine for one parameter set. The timings come from a
+    run with the plain hash functions; the hash counts and the peak memory
+    from a second run, since counting and tracing slow every step down."""
+    state = factory(H, K, D, common)
+    start = time.perf_counter()
+    state.keygen_and_setup()
+    keygen = time.perf_counter() - start
+    step, count = steps(state, H, D)
+    latencies = []
+    for s in range(count):
+        start = time.perf_counter()
+        step(s)
+        latencies.append(time.perf_counter() - start)
+
+    counter = CostCounter()
+    tracemalloc.start()
+    state = factory(H, K, D, counter)
+    state.keygen_and_setup()
+    step, count = steps(state, H, D)
+    for s in range(count):
+        step(s)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    size = state_size(lambda: factory(H, K, D, common), SIZE_INSTANCES)
+    return {'H': H, 'K': K, 'D': D,
+            'keygen': keygen,
+            'latency': {'mean': sum(latencies) / len(latencies),
+                        'p50': percentile(latencies, 50),
+                        'p99': percentile(latencies, 99),
+                        'max': max(latencies)},
+            'hashes': counter.export(),
+            'peak_memory': peak,
+            'state_size': size,
+            'states_per_gb': (1 << 30) // size}
+
+
+def suite():
+    results = []
+    for H, K in GRID:
+        for name, factory in ENGINES:
+            results.append(dict(engine=name, **run(factory, H, K, 1)))
+    name, factory = MT_ENGINE
+    for H, K, D in MT_GRID:
+        results.append(dict(engine=name, **run(factory, H, K, D)))
+    return results
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results):
+    """Prints how the latency and memory of results relate to a baseline."""
+    def key(r):
+        return r['engine'], r['H'], r['K'], r['D']
+    old = {key(r): r for r in baseline['results']}
+    for r in results['results']:
+        if key(r) in old:
+            o = old[key(r)]
+            print('{} H={} K={} D={}: p50 {:.2f}x, state {:.2f}x'.format(
+                *key(r), r['latency']['p50'] / o['latency']['p50'],
+                r['state_size'] / o['state_size']))
+
+
+if __name__ == "__main__":
+    output = sys.argv[1] if len(sys.argv) > 1 else 'bench.json'
+    results = {'commit': commit(), 'hash': common.HASH, 'n': common.N,
+               'time': time.time(), 'results': suite()}
+    for r in results['results']:
+        print('{engine} H={H} K={K} D={D}: keygen {keygen:.3f}s, p50 '
+              '{p50:.1f}us, p99 {p99:.1f}us, {average:.1f} hashes per step '
+              '(worst {worst}), peak {peak_memory} bytes, {states_per_gb} '
+              'states per GB'.format(
+                  p50=r['latency']['p50'] * 1e6, p99=r['latency']['p99'] * 1e6,
+                  average=r['hashes']['average'], worst=r['hashes']['worst'],
+                  **r))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as f:
+            compare(json.load(f), results)
@@ -1,20 +1,23 @@
 #! /usr/bin/env python
 
 import copy
-from common import Node, leafcalc, g, recursive_hash, compute_root, treehash
+import common
+from common import Node, recursive_hash, compute_root, treehash, write_paths
 
 H = 8
-AUTH = [None] * H
-TREEHASH = [None] * H
 
 
 class Treehash(object):
 
-    def __init__(self, h, startidx=0, completed=False):
+    def __init__(self, h, startidx=0, completed=False, hasher=common):
         self.next_idx = startidx
         self.stack = []
         self.completed = completed
         self.h = h
+        self.hasher = hasher
+
+    def restart(self, startidx):
+        self.__init__(self.h, startidx, hasher=self.hasher)
 
     def update(self):
         """Performs one unit of computation on the stack. This can imply either
@@ -24,57 +27,86 @@ class Treehash(object):
         if len(self.stack) >= 2 and self.stack[-1].h == self.stack[-2].h:
             node_r = self.stack.pop()
             node_l = self.stack.pop()
-            self.stack.append(Node(h=node_l.h + 1, v=g(node_l.v + node_r.v)))
+            self.stack.append(Node(h=node_l.h + 1,
+                                   v=self.hasher.g(node_l.v + node_r.v)))
         else:
-            self.stack.append(Node(h=0, v=leafcalc(self.next_idx)))
+            self.stack.append(Node(h=0,
+                                   v=self.hasher.leafcalc(self.next_idx)))
             self.next_idx += 1
         if self.stack[-1].h == self.h:
             self.completed = True
         return
 
-
-def keygen_and_setup():
-    """Sets up TREEHASH and AUTH for the start of classic Merkle traversal."""
-    for h in range(H):
-        TREEHASH[h] = Treehash(h, completed=True)
-    stack = []
-    for j in range(2 ** H):
-        node1 = Node(h=0, v=leafcalc(j))
-        if j == 0:
-            TREEHASH[0].stack = [node1]
-        while stack and stack[-1].h == node1.h:
-            if not AUTH[node1.h]:
-                AUTH[node1.h] = node1
-            node2 = stack.pop()
-            node1 = Node(h=node1.h+1, v=g(node2.v + node1.v))
-            if node1.h < H and not TREEHASH[node1.h].stack:
-                TREEHASH[node1.h].stack.append(node1)
-        stack.append(node1)
-    return stack.pop()
-
-
-def refresh_auth_nodes(s):
-    """Gathers contents for AUTH and restarts Treehash instances."""
-    for h in [h for h in range(H) if ((s + 1) % (2 ** h)) == 0]:
-        AUTH[h] = TREEHASH[h].stack[0]
-        startidx = (s + 1 + 2 ** h) ^ (2 ** h)
-        if startidx < 2 ** H:  # prevent going past 2^H'th leaf node
-            TREEHASH[h].__init__(h, startidx)
-
-
-def build_stacks():
-    """Updates the Treehash instances."""
-    for h in range(H):
-        TREEHASH[h].update()
-        TREEHASH[h].update()
-
-
-def traverse(s):
-    """Returns the auth nodes required for the next path."""
-    authpath = copy.copy(AUTH)
-    refresh_auth_nodes(s)
-    build_stacks()
-    return authpath
+    def low(self):
+        """Returns the lowest height of the nodes on the stack."""
+        return min(node.h for node in self.stack)
+
+
+class ClassicState(object):
+
+    def __init__(self, H=H, hasher=common):
+        self.H = H
+        self.hasher = hasher
+        self.auth = [None] * H
+        self.treehash = [None] * H
+
+    def keygen_and_setup(self):
+        """Sets up TREEHASH and AUTH for the start of classic Merkle
+        traversal."""
+        H = self.H
+        for h in range(H):
+            self.treehash[h] = Treehash(h, completed=True, hasher=self.hasher)
+        stack = []
+        for j in range(2 ** H):
+            node1 = Node(h=0, v=self.hasher.leafcalc(j))
+            if j == 0:
+                self.treehash[0].stack = [node1]
+            while stack and stack[-1].h == node1.h:
+                if not self.auth[node1.h]:
+                    self.auth[node1.h] = node1
+                node2 = stack.pop()
+                node1 = Node(h=node1.h+1, v=self.hasher.g(node2.v + node1.v))
+                if node1.h < H and not self.treehash[node1.h].stack:
+                    self.treehash[node1.h].stack.append(node1)
+            stack.append(node1)
+        self.hasher.step(keygen=True)
+        return stack.pop()
+
+    def refresh_auth_nodes(self, s):
+        """Gathers contents for AUTH and restarts Treehash instances."""
+        H = self.H
+        for h in [h for h in range(H) if ((s + 1) % (2 ** h)) == 0]:
+            self.auth[h] = self.treehash[h].stack[0]
+            startidx = (s + 1 + 2 ** h) ^ (2 ** h)
+            if startidx < 2 ** H:  # prevent going past 2^H'th leaf node
+                self.treehash[h].restart(startidx)
+
+    def build_stacks(self):
+        """Updates the Treehash instances."""
+        for h in range(self.H):
+            self.treehash[h].update()
+            self.treehash[h].update()
+
+    def traverse(self, s):
+        """Returns the auth nodes required for the next path."""
+        authpath = copy.copy(self.auth)
+        self.refresh_auth_nodes(s)
+        self.build_stacks()
+        self.hasher.step()
+        return authpath
+
+    def traverse_range(self, s, n, buf=None):
+        """Writes the auth paths for leaves s, ..., s + n - 1 to buf. This is
+        equivalent to calling traverse n times, but does not copy AUTH."""
+        def advance(i):
+            if i > s:
+                self.refresh_auth_nodes(i - 1)
+                self.build_stacks()
+                self.hasher.step()
+            return self.auth
+        buf = write_paths(advance, self.H, s, n, buf)
+        advance(s + n)
+        return buf
 
 
 if __name__ == "__main__":
@@ -84,7 +116,8 @@ if __name__ == "__main__":
     for _ in range(2 ** (H + 1)):
         th.update()
     print('Treehash class: {}'.format(th.stack[0].v == correct_root))
-    keygen_and_setup()
+    state = ClassicState()
+    state.keygen_and_setup()
     for s in range(2 ** H):
-        root = compute_root(H, s, traverse(s))
+        root = compute_root(H, s, state.traverse(s))
         print('iteration {}: {}'.format(s, root == correct_root))
@@ -1,30 +1,206 @@
+import bisect
 import struct
-from hashlib import sha256
-from collections import namedtuple
-from functools import wraps
+import tracemalloc
+from array import array
+from hashlib import sha256, sha512
+from collections import namedtuple, OrderedDict
 
 Node = namedtuple('Node', ['h', 'v'])
 
-cost = 0
 
+def truncated(fn, size):
+    """Creates a provider that truncates the digests of fn when needed."""
+    def provider(n):
+        if n > size:
+            raise ValueError("Digests are at most {} bytes".format(size))
+        if n == size:
+            return lambda v: fn(v).digest()
+        return lambda v: fn(v).digest()[:n]
+    return provider
 
-def countcost(fn):
-    @wraps(fn)
-    def wrapper(*args, **kwargs):
-        global cost
-        cost += 1
-        return fn(*args, **kwargs)
-    return wrapper
+
+# Every provider takes the output size n and returns a function that maps
+# bytes to n bytes. The blake2 and SHAKE providers produce n bytes natively
+# rather than truncating a longer digest; hashlib can be built without them.
+HASHES = {
+    'sha256': truncated(sha256, 32),
+    'sha512': truncated(sha512, 64),
+}
+try:
+    from hashlib import blake2s, blake2b, shake_128
+    HASHES.update({
+        'blake2s': lambda n: lambda v: blake2s(v, digest_size=n).digest(),
+        'blake2b': lambda n: lambda v: blake2b(v, digest_size=n).digest(),
+        'shake128': lambda n: lambda v: shake_128(v).digest(n),
+    })
+except ImportError:
+    pass
+HASH = 'sha256'
+N = 32  # the size of a node value in bytes
+
+
+def register_hash(name, provider):
+    """Adds a provider to HASHES, so that it can be selected by use_hash. The
+    name is stored in snapshot and node index headers, in 16 bytes."""
+    if len(name.encode()) > 16:
+        raise ValueError("Hash name {!r} is longer than 16 bytes".format(name))
+    HASHES[name] = provider
+
+
+def use_hash(name, n=32):
+    """Selects the hash function that leafcalc and g use for all modules."""
+    global HASH, N, hashfn
+    fn = HASHES[name](n)
+    if len(fn(b'')) != n:
+        raise ValueError("{} does not give {} bytes".format(name, n))
+    hashfn = fn
+    HASH, N = name, n
+
+
+def pool_options():
+    """Returns the initializer arguments for a Pool or ProcessPoolExecutor,
+    so that its worker processes select the hash function that is selected
+    here when the pool is created. Workers may not share it otherwise."""
+    return {'initializer': use_hash, 'initargs': (HASH, N)}
+
+
+use_hash(HASH, N)
 
 
-@countcost
 def leafcalc(j):
-    return sha256(struct.pack("I", j)).digest()
+    return hashfn(struct.pack("I", j))
 
 
-@countcost
 def g(v):
-    return sha256(v).digest()
+    return hashfn(v)
+
+
+class NodeStore(object):
+    """Keeps the values of a fixed number of nodes in one preallocated buffer,
+    addressed by slot, with their heights in a parallel array."""
+
+    def __init__(self, slots, n=None):
+        self.n = N if n is None else n
+        self.buf = bytearray(slots * self.n)
+        self.view = memoryview(self.buf)
+        self.heights = array('B', bytes(slots))
+
+    def get(self, slot, count=1):
+        """Returns a view on the values of count consecutive slots."""
+        return self.view[slot * self.n:(slot + count) * self.n]
+
+    def set(self, slot, h, v):
+        self.buf[slot * self.n:(slot + 1) * self.n] = v
+        self.heights[slot] = h
+
+    def copy(self, dst, src):
+        self.set(dst, self.heights[src], self.get(src))
+
+    def node(self, slot):
+        return Node(h=self.heights[slot], v=bytes(self.get(slot)))
+
+
+def step(keygen=False):
+    """Marks the end of a traversal step (or of keygen). The traversal
+    algorithms use this module as their default hasher, so counting hashes
+    costs nothing unless a CostCounter is passed in its place."""
+    pass
+
+
+class CostCounter(object):
+    """Can be used as a hasher by a traversal instance, to count its leaf and
+    inner node hashes and how many of them are spent per traversal step."""
+
+    def __init__(self):
+        self.leaves = 0
+        self.nodes = 0
+        self.keygen = 0
+        self.steps = 0
+        self.worst = 0
+        self.worst_leaves = 0
+        self.mark = (0, 0)
+
+    def leafcalc(self, j):
+        self.leaves += 1
+        return leafcalc(j)
+
+    def g(self, v):
+        self.nodes += 1
+        return g(v)
+
+    def step(self, keygen=False):
+        leaves = self.leaves - self.mark[0]
+        nodes = self.nodes - self.mark[1]
+        self.mark = (self.leaves, self.nodes)
+        if keygen:
+            self.keygen += leaves + nodes
+            return
+        self.steps += 1
+        self.worst = max(self.worst, leaves + nodes)
+        self.worst_leaves = max(self.worst_leaves, leaves)
+
+    def average(self):
+        """Returns the average number of hashes per traversal step."""
+        if self.steps == 0:
+            return 0
+        return (sum(self.mark) - self.keygen) / self.steps
+
+    def export(self):
+        return {'leaves': self.leaves, 'nodes': self.nodes,
+                'keygen': self.keygen, 'steps': self.steps,
+                'worst': self.worst, 'worst_leaves': self.worst_leaves,
+                'average': self.average()}
+
+
+class LeafCache(object):
+    """Can be used as a hasher, to remember up to maxsize leaf values. The
+    same instance can be shared by keygen, traversal and compute_root, so
+    that a leaf is only computed again once it has been evicted. Leaves are
+    evicted least recently used first, or with evict='ahead', as suits a
+    single key that is traversed: leaves below the number of traversal steps
+    taken go first, as they are not needed again, and otherwise the leaf that
+    is furthest ahead. Other hash calls are passed on to hasher."""
+
+    def __init__(self, maxsize, hasher=None, evict='lru'):
+        assert evict in ('lru', 'ahead')
+        self.maxsize = maxsize
+        self.hasher = hasher
+        self.evict = evict
+        self.values = OrderedDict()
+        self.order = []  # the cached indices in order, for evict='ahead'
+        self.position = 0
+        self.hits = 0
+        self.misses = 0
+
+    def leafcalc(self, j):
+        v = self.values.get(j)
+        if v is not None:
+            self.hits += 1
+            if self.evict == 'lru':
+                self.values.move_to_end(j)
+            return v
+        self.misses += 1
+        v = leafcalc(j) if self.hasher is None else self.hasher.leafcalc(j)
+        self.values[j] = v
+        if self.evict == 'ahead':
+            bisect.insort(self.order, j)
+        if len(self.values) > self.maxsize:
+            if self.evict == 'lru':
+                self.values.popitem(last=False)
+            elif self.order[0] < self.position:
+                del self.values[self.order.pop(0)]
+            else:
+                del self.values[self.order.pop()]
+        return v
+
+    def g(self, v):
+        return g(v) if self.hasher is None else self.hasher.g(v)
+
+    def step(self, keygen=False):
+        if not keygen:
+            self.position += 1
+        if self.hasher is not None:
+            self.hasher.step(keygen)
 
 
 def recursive_hash(h, i=0):
@@ -34,8 +210,25 @@ def recursive_hash(h, i=0):
     return g(recursive_hash(h - 1, i) + recursive_hash(h-1, i + (2 ** (h-1))))
 
 
-def treehash(h):
+def hash_level(level):
+    """Computes the next level of a tree from a level of concatenated digests,
+    by hashing each adjacent pair."""
+    return b''.join(g(level[i:i + 2*N]) for i in range(0, len(level), 2*N))
+
+
+def batched_treehash(h, start=0):
+    """Computes the root node by hashing the tree one level at a time, keeping
+    each level as a single bytes buffer instead of a stack of Nodes."""
+    level = b''.join(leafcalc(j) for j in range(start, start + (1 << h)))
+    for _ in range(h):
+        level = hash_level(level)
+    return Node(h=h, v=level)
+
+
+def treehash(h, batched=False):
     """Computes the root node using treehash."""
+    if batched:
+        return batched_treehash(h)
     stack = []
     for j in range(2 ** h):
         node1 = Node(h=0, v=leafcalc(j))
@@ -50,13 +243,137 @@ def end_of_tree(idx, tree_h, level):
     return ((idx + 1) & ((1 << ((level+1)*tree_h)) - 1)) == 0
 
 
-def compute_root(H, idx, authpath):
-    """Computes the root node of the tree from leaf idx using the auth path."""
-    v = leafcalc(idx)
-    for authnode in authpath:
+class LowIndex(object):
+    """Index of the treehash instances that are not completed, by the lowest
+    height of their nodes on the stack, kept as bitmasks. The instance to
+    update next, the lowest one with ties going to the smallest h, is found in
+    O(1) rather than by scanning every instance and its part of the stack."""
+
+    def __init__(self, size):
+        self.masks = [0] * size  # instances per low height
+        self.levels = 0  # low heights with at least one instance
+        self.lows = [None] * size
+
+    def set(self, h, low):
+        """Files instance h under low, or removes it if low is None."""
+        old = self.lows[h]
+        if old is not None:
+            self.masks[old] &= ~(1 << h)
+            if not self.masks[old]:
+                self.levels &= ~(1 << old)
+        self.lows[h] = low
+        if low is not None:
+            self.masks[low] |= 1 << h
+            self.levels |= 1 << low
+
+    def lowest(self):
+        if not self.levels:
+            return None
+        mask = self.masks[(self.levels & -self.levels).bit_length() - 1]
+        return (mask & -mask).bit_length() - 1
+
+
+class TopCache(object):
+    """Holds the nodes of the top depth levels of a tree of height H, up to
+    maxsize of them, evicting the least recently used nodes first."""
+
+    def __init__(self, H, depth, maxsize=None):
+        self.H = H
+        self.depth = depth
+        self.maxsize = maxsize
+        self.nodes = OrderedDict()
+        self.root = None
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, h, i, v):
+        if h == self.H:
+            self.root = v
+        elif h >= self.H - self.depth:
+            self.nodes[(h, i)] = v
+            self.nodes.move_to_end((h, i))
+            if self.maxsize is not None and len(self.nodes) > self.maxsize:
+                self.nodes.popitem(last=False)
+
+    def get(self, h, i):
+        v = self.nodes.get((h, i))
+        if v is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.nodes.move_to_end((h, i))
+        return v
+
+
+def compute_root(H, idx, authpath, cache=None, hasher=None):
+    """Computes the root node of the tree from leaf idx using the auth path.
+    Given a TopCache, the computation stops as soon as it reaches a cached
+    node, and the top nodes of a path that leads to the cached root (or to a
+    cached node) are added to the cache."""
+    hash_leaf = leafcalc if hasher is None else hasher.leafcalc
+    hash_node = g if hasher is None else hasher.g
+    v = hash_leaf(idx)
+    verified = []
+    for h, authnode in enumerate(authpath):
+        if cache is not None and h >= H - cache.depth:
+            if cache.get(h, idx) == v:
+                v = cache.root
+                break
+            verified += [(h, idx, v), (h, idx ^ 1, authnode.v)]
         if idx & 1:
-            v = g(authnode.v + v)
+            v = hash_node(authnode.v + v)
         else:
-            v = g(v + authnode.v)
+            v = hash_node(v + authnode.v)
         idx >>= 1
+    if cache is not None and cache.root == v:
+        for node in verified:
+            cache.add(*node)
     return v
+
+
+def write_paths(traverse, H, s, n, buf=None):
+    """Writes the auth paths returned by traverse(s), ..., traverse(s + n - 1)
+    to one contiguous buffer of n * H * N bytes. Consecutive paths share most
+    of their nodes, so every path starts as a copy of the previous one and
+    only the nodes that were replaced are written."""
+    size = H * N
+    buf = bytearray(n * size) if buf is None else buf
+    view = memoryview(buf)
+    last = [None] * H
+    for i in range(n):
+        auth = traverse(s + i)
+        offset = i * size
+        if i > 0:
+            view[offset:offset + size] = view[offset - size:offset]
+        for h in range(H):
+            if auth[h] is not last[h]:
+                view[offset + h*N:offset + (h+1)*N] = auth[h].v
+                last[h] = auth[h]
+    return buf
+
+
+def read_path(buf, H, i=0):
+    """Returns the i-th auth path from a buffer filled by write_paths."""
+    offset = i * H * N
+    return [Node(h=h, v=bytes(buf[offset + h*N:offset + (h+1)*N]))
+            for h in range(H)]
+
+
+def state_size(factory, count=1000):
+    """Measures the memory that count states hold after keygen, per state."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    states = [factory() for _ in range(count)]
+    for state in states:
+        state.keygen_and_setup()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size // count
+
+
+def percentile(values, p):
+    """Returns the p-th percentile of values, or None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
@@ -0,0 +1,139 @@
+#! /usr/bin/env python
+
+import common
+from common import (Node, CostCounter, recursive_hash, compute_root,
+                    write_paths, state_size)
+
+H = 8
+h = 2  # the height of the subtrees
+
+
+class Treehash(object):
+
+    def __init__(self, h, low, startidx=0, hasher=common):
+        self.next_idx = startidx
+        self.stack = []
+        self.nodes = {}
+        self.completed = False
+        self.h = h
+        self.low = low
+        self.hasher = hasher
+
+    def update(self):
+        """Performs one unit of computation, i.e. computes one leaf or parent
+        node. Nodes at heights low and up are kept, by (height, index)."""
+        if self.completed:
+            return
+        if len(self.stack) >= 2 and self.stack[-1].h == self.stack[-2].h:
+            node_r = self.stack.pop()
+            node_l = self.stack.pop()
+            node = Node(h=node_l.h + 1, v=self.hasher.g(node_l.v + node_r.v))
+        else:
+            node = Node(h=0, v=self.hasher.leafcalc(self.next_idx))
+            self.next_idx += 1
+        self.stack.append(node)
+        if node.h == self.h:
+            self.completed = True
+        elif node.h >= self.low:
+            self.nodes[(node.h, (self.next_idx - 1) >> node.h)] = node
+
+
+class FractalState(object):
+    """Fractal Merkle tree traversal, as described by Jakobsson, Leighton,
+    Micali and Szydlo. The tree is split into H / h levels of subtrees of
+    height h. For every level, the state holds the subtree with the current
+    leaf (Exist) and builds the next one (Desire) with 2 units of hashing per
+    step. Exist nodes are dropped once they have been used, so Exist shrinks
+    while Desire grows."""
+
+    def __init__(self, H=H, h=h, hasher=common):
+        assert H % h == 0
+        self.H = H
+        self.h = h
+        self.L = H // h
+        self.hasher = hasher
+        self.auth = [None] * H
+        self.exist = [{} for _ in range(self.L)]
+        self.desire = [None] * (self.L - 1)  # the top level has just one
+
+    def keygen_and_setup(self):
+        """Sets up the first two subtrees of every level, and AUTH."""
+        H, h, L = self.H, self.h, self.L
+        for i in range(L - 1):
+            self.desire[i] = Treehash((i + 1) * h, i * h, 1 << ((i + 1) * h),
+                                      self.hasher)
+        stack = []
+        for j in range(1 << H):
+            node1 = Node(h=0, v=self.hasher.leafcalc(j))
+            while True:
+                i = node1.h // h
+                if i < L:  # i.e. node1 is not the root
+                    subtree = j >> ((i + 1) * h)
+                    if subtree == 0:
+                        self.exist[i][(node1.h, j >> node1.h)] = node1
+                    elif subtree == 1 and i < L - 1:
+                        self.desire[i].nodes[(node1.h, j >> node1.h)] = node1
+                if not stack or stack[-1].h != node1.h:
+                    break
+                node2 = stack.pop()
+                node1 = Node(h=node1.h + 1, v=self.hasher.g(node2.v + node1.v))
+            stack.append(node1)
+        for i in range(L - 1):
+            self.desire[i].completed = True
+        for j in range(H):
+            self.auth[j] = self.exist[j // h][(j, 1)]
+        self.hasher.step(keygen=True)
+        return stack.pop()
+
+    def traverse(self, s):
+        """Returns the auth nodes for leaf s + 1."""
+        H, h, L = self.H, self.h, self.L
+        for j in range(H):  # drop the nodes that leaf s was the last to use
+            if (s + 1) & ((1 << j) - 1):
+                break
+            del self.exist[j // h][(j, (s >> j) ^ 1)]
+        for i in range(L - 1):
+            if (s + 1) & ((1 << ((i + 1) * h)) - 1) == 0:
+                self.exist[i] = self.desire[i].nodes
+                startidx = s + 1 + (1 << ((i + 1) * h))
+                if startidx < 1 << H:
+                    self.desire[i] = Treehash((i + 1) * h, i * h, startidx,
+                                              self.hasher)
+                else:
+                    self.desire[i] = None
+        for i in range(L - 1):
+            if self.desire[i] is not None:
+                self.desire[i].update()
+                self.desire[i].update()
+        for j in range(H):
+            self.auth[j] = self.exist[j // h][(j, ((s + 1) >> j) ^ 1)]
+        self.hasher.step()
+        return self.auth
+
+    def traverse_range(self, s, n, buf=None):
+        """Writes the auth paths for leaves s + 1, ..., s + n to buf."""
+        return write_paths(self.traverse, self.H, s, n, buf)
+
+
+if __name__ == "__main__":
+    from bdstraversal_mt_c_like import BDSState
+    correct_root = recursive_hash(H)
+    state = FractalState()
+    state.keygen_and_setup()
+    for s in range((1 << H) - 1):
+        assert compute_root(H, s + 1, state.traverse(s)) == correct_root
+    engines = [('BDSState, K={}'.format(K),
+                lambda hasher, K=K: BDSState(H, K, hasher)) for K in (2, 4)]
+    engines += [('FractalState, h={}'.format(sub),
+                 lambda hasher, sub=sub: FractalState(H, sub, hasher))
+                for sub in (1, 2, 4)]
+    for name, factory in engines:
+        counter = CostCounter()
+        state = factory(counter)
+        state.keygen_and_setup()
+        step = getattr(state, 'traverse_and_update', state.traverse)
+        for s in range((1 << H) - 1):
+            step(s)
+        size = state_size(lambda: factory(common), 100)
+        print('H={}, {}: {:.2f} hashes per step (worst {}), {} bytes'.format(
+            H, name, counter.average(), counter.worst, size))
@@ -0,0 +1,25 @@
+#! /usr/bin/env python
+
+import time
+from common import HASHES, use_hash, recursive_hash, compute_root
+from bdstraversal_c_like import BDSState, H
+
+SIZES = [16, 24, 32]
+
+
+if __name__ == "__main__":
+    for name in sorted(HASHES):
+        for n in SIZES:
+            use_hash(name, n)
+            state = BDSState()
+            start = time.time()
+            state.keygen_and_setup()
+            keygen = time.time() - start
+            start = time.time()
+            for s in range((1 << H) - 1):
+                auth = state.traverse(s)
+            traversal = time.time() - start
+            assert compute_root(H, s + 1, auth) == recursive_hash(H)
+            print('{:>8}-{}: keygen {:.4f}s, {:.0f} traversal steps/s'.format(
+                name, 8 * n, keygen, ((1 << H) - 1) / traversal))
+    use_hash('sha256')
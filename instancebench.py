@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+
+import time
+from common import state_size
+from classictraversal import ClassicState
+from logtraversal import LogState
+import bdstraversal
+import bdstraversal_c_like
+import bdstraversal_mt_c_like
+import bdstraversal_compact
+
+INSTANCES = 100
+ENGINES = [
+    ('classic', lambda H, K: ClassicState(H)),
+    ('log', lambda H, K: LogState(H)),
+    ('bds', bdstraversal.BDSState),
+    ('bds_c_like', bdstraversal_c_like.BDSState),
+    ('BDSState', bdstraversal_mt_c_like.BDSState),
+    ('compact BDSState', bdstraversal_compact.BDSState),
+]
+
+
+def step_latency(states, steps):
+    """Interleaves traversal steps over all states, as a signer holding many
+    keys would, and returns the average time per step."""
+    start = time.time()
+    for s in range(steps):
+        for state in states:
+            if hasattr(state, 'traverse_and_update'):
+                state.traverse_and_update(s)
+            else:
+                state.traverse(s)
+    return (time.time() - start) / (steps * len(states))
+
+
+def batch_speedup(factory, H, K):
+    """Compares signing all leaves one traverse call at a time with signing
+    them through a single traverse_range call."""
+    state = factory(H, K)
+    state.keygen_and_setup()
+    step = getattr(state, 'traverse_and_update', state.traverse)
+    start = time.time()
+    for s in range((1 << H) - 1):
+        [node.v for node in step(s)]
+    loop = time.time() - start
+    state = factory(H, K)
+    state.keygen_and_setup()
+    start = time.time()
+    state.traverse_range(0, (1 << H) - 1)
+    return loop / (time.time() - start)
+
+
+if __name__ == "__main__":
+    for H, K in [(6, 2), (8, 4)]:
+        for name, factory in ENGINES:
+            size = state_size(lambda: factory(H, K), INSTANCES)
+            states = [factory(H, K) for _ in range(INSTANCES)]
+            for state in states:
+                state.keygen_and_setup()
+            latency = step_latency(states, (1 << H) - 1)
+            print('H={}, K={}, {}: {} bytes per instance, {:.1f}us per step'
+                  .format(H, K, name, size, latency * 1e6))
+    for name, factory in ENGINES:
+        print('H=10, K=4, {}: traverse_range is {:.2f}x as fast'.format(
+            name, batch_speedup(factory, 10, 4)))
@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+
+import os
+import time
+import random
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+import common
+from bdstraversal_mt_c_like import BDSState, MTBDSState
+from snapshot import dumps, loads, save, load
+
+
+def authpath(state):
+    if isinstance(state, MTBDSState):
+        return [list(auth) for auth in state.authpaths()]
+    return list(state.auth)
+
+
+def leaves(state):
+    if isinstance(state, MTBDSState):
+        return 1 << (state.D * state.H)
+    return 1 << state.H
+
+
+def advance(args):
+    """Takes the traversal step after leaf on a snapshot, and returns the
+    snapshot and auth path(s) for the next leaf."""
+    snapshot, leaf = args
+    state, _ = loads(snapshot)
+    if isinstance(state, MTBDSState):
+        state.traverse(leaf)
+    else:
+        state.traverse_and_update(leaf)
+    return dumps(state, leaf + 1), authpath(state)
+
+
+class KeyPool(object):
+    """Signs with many keys, each with its own BDSState or MTBDSState. The
+    states are kept as snapshots. After a signature, the traversal step for
+    the key's next leaf runs in a pool of worker processes, so that busy
+    keys are stepped in parallel. At most resident keys are kept in memory;
+    the least recently used ones are spilled to snapshot files in directory,
+    and loaded again when they are next used. The workers and snapshot files
+    use the default hasher, so every state must use it too."""
+
+    def __init__(self, directory, resident=64, processes=None):
+        self.directory = directory
+        self.resident = resident
+        self.pool = ProcessPoolExecutor(processes, **common.pool_options())
+        self.entries = OrderedDict()  # key -> (leaf, path, snapshot)
+        self.paths = {}
+        self.metrics = {}
+
+    def add(self, key, state, leaf=0):
+        """Adds a key with a state that has been set up, at leaf."""
+        if key in self.paths:
+            raise ValueError("Key {!r} is already in the pool".format(key))
+        if state.hasher is not common:
+            raise ValueError("Key {!r} does not use the default "
+                             "hasher".format(key))
+        self.paths[key] = os.path.join(self.directory,
+                                       '{}.state'.format(len(self.paths)))
+        self.metrics[key] = {'signatures': 0, 'spills': 0, 'loads': 0,
+                             'wait': 0.0, 'latency': 0.0,
+                             'leaves': leaves(state)}
+        self.entries[key] = (leaf, authpath(state), dumps(state, leaf))
+        self.evict()
+
+    def entry(self, key):
+        """Returns the entry of a key, waiting for its pending step and
+        loading it from disk if needed."""
+        metrics = self.metrics[key]
+        if key not in self.entries:
+            state, leaf = load(self.paths[key])
+            self.entries[key] = (leaf, authpath(state), dumps(state, leaf))
+            metrics['loads'] += 1
+            self.evict(key)
+        leaf, path, snapshot = self.entries[key]
+        if isinstance(snapshot, Future):  # the step is still pending
+            start = time.perf_counter()
+            snapshot, path = snapshot.result()
+            metrics['wait'] += time.perf_counter() - start
+            self.entries[key] = (leaf, path, snapshot)
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def sign(self, key):
+        """Returns the next leaf index of key and its auth path(s)."""
+        start = time.perf_counter()
+        metrics = self.metrics[key]
+        leaf, path, snapshot = self.entry(key)
+        if leaf >= metrics['leaves']:
+            raise ValueError("All leaves of {!r} have been used".format(key))
+        if leaf + 1 < metrics['leaves']:
+            self.entries[key] = (leaf + 1, None, self.pool.submit(
+                advance, (snapshot, leaf)))
+        else:
+            self.entries[key] = (leaf + 1, None, snapshot)
+        metrics['signatures'] += 1
+        metrics['latency'] += time.perf_counter() - start
+        return leaf, path
+
+    def evict(self, keep=None):
+        """Spills the least recently used keys other than keep, until at
+        most resident keys are in memory."""
+        while len(self.entries) > self.resident:
+            key = next((k for k in self.entries if k != keep), None)
+            if key is None:
+                break
+            self.spill(key)
+            self.metrics[key]['spills'] += 1
+
+    def spill(self, key):
+        """Writes the state of a resident key to its file."""
+        leaf, path, snapshot = self.entry(key)
+        state, _ = loads(snapshot)
+        save(self.paths[key], state, leaf)
+        del self.entries[key]
+
+    def stats(self):
+        """Returns the metrics summed over all keys."""
+        total = {}
+        for metrics in self.metrics.values():
+            for name in ['signatures', 'spills', 'loads', 'wait', 'latency']:
+                total[name] = total.get(name, 0) + metrics[name]
+        total['keys'] = len(self.metrics)
+        total['resident'] = len(self.entries)
+        return total
+
+    def close(self):
+        """Waits for the pending steps and writes the resident keys to their
+        files, so that the file of every key holds its latest state."""
+        for key in list(self.entries):
+            self.spill(key)
+        self.pool.shutdown()
+
+
+if __name__ == "__main__":
+    H, K, KEYS, SIGNATURES = 8, 2, 200, 4000
+    state = BDSState(H, K)
+    state.keygen_and_setup()  # every key has the same tree here
+    for processes in [1, 2, 4]:
+        pool = KeyPool(tempfile.mkdtemp(), resident=32, processes=processes)
+        for key in range(KEYS):
+            pool.add(key, state)
+        start = time.time()
+        for _ in range(SIGNATURES):
+            pool.sign(random.randrange(KEYS // 10))  # a few keys are busy
+        elapsed = time.time() - start
+        stats = pool.stats()
+        pool.close()
+        print('{} processes: {:.0f} signatures/s, {} spills, {} loads, '
+              '{:.2f}s waiting for steps'.format(
+                  processes, SIGNATURES / elapsed, stats['spills'],
+                  stats['loads'], stats['wait']))
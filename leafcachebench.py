@@ -0,0 +1,47 @@
+#! /usr/bin/env python
+
+import time
+from common import LeafCache, CostCounter, leafcalc, g, compute_root
+from bdstraversal_mt_c_like import BDSState
+
+ROUNDS = 64  # the cost of a leaf, in hashes
+
+
+class SlowLeaves(CostCounter):
+    """Counts hashes like a CostCounter, but makes every leaf as expensive as
+    ROUNDS hashes, as a stand-in for e.g. a WOTS public key."""
+
+    def leafcalc(self, j):
+        self.leaves += 1
+        v = leafcalc(j)
+        for _ in range(ROUNDS - 1):
+            v = g(v)
+        return v
+
+
+def run(H, K, hasher):
+    """Sets up a state, then traverses and verifies every leaf."""
+    state = BDSState(H, K, hasher)
+    root = state.keygen_and_setup().v
+    assert compute_root(H, 0, state.auth, hasher=hasher) == root
+    for s in range((1 << H) - 1):
+        auth = state.traverse_and_update(s)
+        assert compute_root(H, s + 1, auth, hasher=hasher) == root
+
+
+if __name__ == "__main__":
+    H, K = 10, 4
+    counter = SlowLeaves()
+    start = time.time()
+    run(H, K, counter)
+    print('no cache: {} leaves computed, {:.2f}s'.format(
+        counter.leaves, time.time() - start))
+    for evict in ['lru', 'ahead']:
+        for maxsize in [16, 64, 256, 1024]:
+            counter = SlowLeaves()
+            cache = LeafCache(maxsize, counter, evict)
+            start = time.time()
+            run(H, K, cache)
+            print('{} cache of {}: {} leaves computed, {} hits, {:.2f}s'
+                  .format(evict, maxsize, counter.leaves, cache.hits,
+                          time.time() - start))
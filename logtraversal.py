@@ -1,43 +1,36 @@
 #! /usr/bin/env python
 
-import copy
 from common import recursive_hash, compute_root
-from classictraversal import (refresh_auth_nodes, Treehash, keygen_and_setup,
-                              H, AUTH, TREEHASH)
-
-
-# monkey patch a bound function that enables easily using STACK_h.low
-Treehash.low = lambda self: min(node.h for node in self.stack)
-
-
-def traverse(s):
-    """Returns the auth nodes by updating the most needed stacks first."""
-    authpath = copy.copy(AUTH)
-    refresh_auth_nodes(s)
-
-    # build stacks
-    for _ in range(2*H - 1):
-        l_min = float('inf')
-        focus = None
-        for h in range(H):
-            if TREEHASH[h].completed:
-                low = float('inf')
-            elif len(TREEHASH[h].stack) == 0:
-                low = h
-            else:
-                low = TREEHASH[h].low()
-            if low < l_min:
-                focus = h
-                l_min = low
-        if focus is not None:
-            TREEHASH[focus].update()
-
-    return authpath
+from classictraversal import ClassicState, H
+
+
+class LogState(ClassicState):
+    """Classic traversal that updates the most needed stacks first."""
+
+    def build_stacks(self):
+        """Updates the Treehash instances with the lowest nodes first."""
+        H = self.H
+        for _ in range(2*H - 1):
+            l_min = float('inf')
+            focus = None
+            for h in range(H):
+                if self.treehash[h].completed:
+                    low = float('inf')
+                elif len(self.treehash[h].stack) == 0:
+                    low = h
+                else:
+                    low = self.treehash[h].low()
+                if low < l_min:
+                    focus = h
+                    l_min = low
+            if focus is not None:
+                self.treehash[focus].update()
 
 
 if __name__ == "__main__":
     correct_root = recursive_hash(H)
-    keygen_and_setup()
+    state = LogState()
+    state.keygen_and_setup()
     for s in range(2 ** H):
-        root = compute_root(H, s, traverse(s))
+        root = compute_root(H, s, state.traverse(s))
         print('iteration {}: {}'.format(s, root == correct_root))
@@ -0,0 +1,137 @@
+#! /usr/bin/env python
+
+import os
+import mmap
+import time
+import struct
+import tempfile
+import common
+from common import Node, CostCounter, recursive_hash, compute_root
+
+# A node index consists of a header, followed by the stored levels from the
+# bottom up. Level h holds the 2^(H-h) node values of height h, of N bytes
+# each, ordered by their index within the level.
+MAGIC = b'MTNI'
+VERSION = 2
+# magic, version, H, N, mask of levels, name of the hash function
+HEADER = struct.Struct('<4sBBBQ16s')
+
+
+def every(H, stride, start=0):
+    """Returns the heights start, start + stride, ... up to the root. Every
+    auth node can then be computed with fewer than 2^stride hashes, from
+    about 2^(H-start) / (1 - 2^-stride) stored nodes."""
+    return list(range(start, H + 1, stride))
+
+
+def layout(H, levels):
+    """Returns the offset in the index file of every stored level, and the
+    size of the file."""
+    offsets = {}
+    offset = HEADER.size
+    for h in sorted(levels):
+        offsets[h] = offset
+        offset += (1 << (H - h)) * common.N
+    return offsets, offset
+
+
+def build(path, H, levels, hasher=common):
+    """Computes the tree once, and writes the nodes at heights levels to a
+    node index file at path."""
+    n = common.N
+    offsets, size = layout(H, levels)
+    mask = sum(1 << h for h in set(levels))
+    with open(path, 'w+b') as f:
+        f.truncate(size)
+        with mmap.mmap(f.fileno(), size) as buf:
+            buf[:HEADER.size] = HEADER.pack(
+                MAGIC, VERSION, H, n, mask, common.HASH.encode())
+            stack = []
+            for j in range(1 << H):
+                node1 = Node(h=0, v=hasher.leafcalc(j))
+                while True:
+                    if node1.h in offsets:
+                        offset = offsets[node1.h] + (j >> node1.h) * n
+                        buf[offset:offset + n] = node1.v
+                    if not stack or stack[-1].h != node1.h:
+                        break
+                    node2 = stack.pop()
+                    node1 = Node(h=node1.h + 1, v=hasher.g(node2.v + node1.v))
+                stack.append(node1)
+            buf.flush()
+    hasher.step(keygen=True)
+    return stack.pop()
+
+
+class NodeIndex(object):
+    """Serves the auth path of any leaf from a memory-mapped node index. Nodes
+    at heights that are not stored are computed from the closest stored level
+    below them, or from the leaves if there is none."""
+
+    def __init__(self, path, hasher=common):
+        self.hasher = hasher
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.H, n, mask, name = HEADER.unpack_from(self.buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a version {} node index".format(VERSION))
+        if n != common.N:
+            raise ValueError("Node index node size does not match N")
+        if name.rstrip(b'\0') != common.HASH.encode():
+            raise ValueError("Node index hash function does not match HASH")
+        self.levels = [h for h in range(self.H + 1) if (mask >> h) & 1]
+        self.offsets, _ = layout(self.H, self.levels)
+
+    def close(self):
+        self.buf.close()
+
+    def values(self, h, i, count):
+        """Returns count consecutive node values of height h, from index i."""
+        n = common.N
+        if h in self.offsets:
+            offset = self.offsets[h] + i * n
+            return [self.buf[j:j + n]
+                    for j in range(offset, offset + count * n, n)]
+        low = max([level for level in self.levels if level < h],
+                  default=None)
+        if low is None:
+            low = 0
+            values = [self.hasher.leafcalc(j)
+                      for j in range(i << h, (i + count) << h)]
+        else:
+            values = self.values(low, i << (h - low), count << (h - low))
+        for _ in range(h - low):
+            values = [self.hasher.g(values[j] + values[j + 1])
+                      for j in range(0, len(values), 2)]
+        return values
+
+    def node(self, h, i):
+        return Node(h=h, v=self.values(h, i, 1)[0])
+
+    def authpath(self, idx):
+        """Returns the auth path of leaf idx, as traverse would."""
+        return [self.node(h, (idx >> h) ^ 1) for h in range(self.H)]
+
+
+if __name__ == "__main__":
+    import random
+    H = 16
+    correct_root = recursive_hash(H)
+    directory = tempfile.mkdtemp()
+    leaves = [random.randrange(1 << H) for _ in range(200)]
+    filename = os.path.join(directory, 'index')
+    for stride in range(1, 7):
+        for lowest in sorted({0, stride - 1}):
+            levels = every(H, stride, lowest)
+            build(filename, H, levels)
+            counter = CostCounter()
+            index = NodeIndex(filename, counter)
+            start = time.time()
+            for idx in leaves:
+                path = index.authpath(idx)
+                assert compute_root(H, idx, path) == correct_root
+            print('levels {}: {} bytes, {:.1f} hashes, {:.0f}us per path'
+                  .format(levels, os.path.getsize(filename),
+                          (counter.leaves + counter.nodes) / len(leaves),
+                          (time.time() - start) / len(leaves) * 1e6))
+            index.close()
@@ -0,0 +1,136 @@
+#! /usr/bin/env python
+
+import time
+from multiprocessing import Pool, cpu_count
+import common
+from common import Node, treehash
+from classictraversal import Treehash
+import bdstraversal
+import bdstraversal_c_like
+
+
+def keep(h, i, top):
+    """Keygen only needs the first row-indices of every level, and all nodes
+    of the levels at or above top (i.e. the ones that end up in RETAIN)."""
+    return i < 4 or h >= top
+
+
+def hash_subtree(h, s, top, hasher=common):
+    """Computes the subtree of height h with index s one level at a time.
+    Returns the root and the nodes that are selected by keep(), indexed by
+    (height, row-index)."""
+    n = common.N
+    nodes = {}
+    level = b''.join(hasher.leafcalc(j) for j in range(s << h, (s + 1) << h))
+    for height in range(h):
+        first = s << (h - height)
+        for i in range(first, first + (len(level) // n)):
+            if keep(height, i, top):
+                nodes[(height, i)] = level[(i - first)*n:(i - first + 1)*n]
+        level = b''.join(hasher.g(level[i:i + 2*n])
+                         for i in range(0, len(level), 2*n))
+    return level, nodes
+
+
+def subtree(args):
+    """Computes a subtree with the default hasher in a worker process."""
+    h, s, top = args
+    return hash_subtree(h, s, top)
+
+
+def build_nodes(H, top, k, processes=None, hasher=common):
+    """Splits the tree of height H into 2^k subtrees that are hashed in a
+    process pool, and merges their roots into the top k levels. Any other
+    hasher than the default one is only used with processes=1, where the
+    subtrees are hashed in this process, one after the other."""
+    assert 0 <= k <= H
+    if processes == 1:
+        results = [hash_subtree(H - k, s, top, hasher) for s in range(1 << k)]
+    elif hasher is not common:
+        raise ValueError("Only the default hasher can be used in a process "
+                         "pool; use processes=1")
+    else:
+        jobs = [(H - k, s, top) for s in range(1 << k)]
+        with Pool(processes, **common.pool_options()) as pool:
+            results = pool.map(subtree, jobs)
+    nodes = {}
+    for root, result in results:
+        nodes.update(result)
+    level = [root for root, result in results]
+    for h in range(H - k, H):
+        for i, v in enumerate(level):
+            if keep(h, i, top):
+                nodes[(h, i)] = v
+        level = [hasher.g(level[i] + level[i + 1])
+                 for i in range(0, len(level), 2)]
+    nodes[(H, 0)] = level[0]
+    hasher.step(keygen=True)
+    return nodes
+
+
+def keygen_classic(state, k, processes=None):
+    """Parallel equivalent of ClassicState.keygen_and_setup()."""
+    H = state.H
+    nodes = build_nodes(H, H, k, processes, state.hasher)
+    for h in range(H):
+        state.treehash[h] = Treehash(h, completed=True, hasher=state.hasher)
+        state.treehash[h].stack = [Node(h=h, v=nodes[(h, 0)])]
+        state.auth[h] = Node(h=h, v=nodes[(h, 1)])
+    return Node(h=H, v=nodes[(H, 0)])
+
+
+def keygen_bds(state, k, processes=None):
+    """Parallel equivalent of bdstraversal.BDSState.keygen_and_setup()."""
+    H, K = state.H, state.K
+    nodes = build_nodes(H, H - K, k, processes, state.hasher)
+    for h in range(H):
+        state.auth[h] = Node(h=h, v=nodes[(h, 1)])
+    for h in range(H - K):
+        state.treehash[h] = bdstraversal.Treehash(
+            h, state.stack, completed=True, hasher=state.hasher,
+            index=state.index)
+        state.treehash[h].node = Node(h=h, v=nodes[(h, 3)])
+    for h in range(H - K, H - 1):
+        retain = state.retain[h - (H - K)]
+        for i in range(3, 1 << (H - h), 2):
+            retain.appendleft(Node(h=h, v=nodes[(h, i)]))
+    return Node(h=H, v=nodes[(H, 0)])
+
+
+def keygen_state(state, k, processes=None):
+    """Parallel equivalent of BDSState.keygen_and_setup(), for both the
+    bdstraversal_c_like and the bdstraversal_mt_c_like state."""
+    H, K = state.H, state.K
+    nodes = build_nodes(H, H - K, k, processes, state.hasher)
+    for h in range(H - K):
+        if state.treehash[h] is None:
+            state.treehash[h] = bdstraversal_c_like.Treehash(
+                h, state.stack, completed=True, hasher=state.hasher,
+                index=state.index)
+    for h in range(H):
+        state.auth[h] = Node(h=h, v=nodes[(h, 1)])
+        if h < H - K:
+            state.treehash[h].node = Node(h=h, v=nodes[(h, 3)])
+        else:
+            offset = (1 << (H - 1 - h)) + h - H
+            for i in range(3, 1 << (H - h), 2):
+                node = Node(h=h, v=nodes[(h, i)])
+                state.retain[offset + ((i - 3) >> 1)] = node
+    return Node(h=H, v=nodes[(H, 0)])
+
+
+if __name__ == "__main__":
+    H, K = 16, 4
+    start = time.time()
+    correct_root = treehash(H).v
+    print('serial: {:.2f}s'.format(time.time() - start))
+    start = time.time()
+    assert treehash(H, batched=True).v == correct_root
+    print('serial, batched: {:.2f}s'.format(time.time() - start))
+    for processes in range(1, cpu_count() + 1):
+        for k in (2, 4, 6):
+            start = time.time()
+            nodes = build_nodes(H, H - K, k, processes)
+            assert nodes[(H, 0)] == correct_root
+            print('{} processes, 2^{} subtrees: {:.2f}s'.format(
+                processes, k, time.time() - start))
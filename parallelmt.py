@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+import common
+from common import recursive_hash, compute_root, end_of_tree
+from bdstraversal_mt_c_like import BDSState, MTBDSState, H, K, D
+from snapshot import dumps, loads
+
+
+def build_state(args, hasher=common):
+    """Builds the state of a complete next tree, as MTBDSState would have
+    done one leaf per step, and returns it as a snapshot."""
+    H, K = args
+    state = BDSState(H, K, hasher)
+    for j in range(1 << H):
+        state.stack_update(j)
+    state.nextidx = 1 << H
+    return dumps(state, 0)
+
+
+class ParallelMTBDSState(MTBDSState):
+    """MTBDSState that builds the next tree of every layer in a worker
+    process, instead of interleaving it with the updates of the current
+    trees. The whole update budget goes to the current trees, and the next
+    trees of all layers are built at the same time. A state that is restored
+    from a snapshot has processes=0. Workers use the default hasher, so a
+    state with another hasher must have processes=0."""
+
+    def __init__(self, H=H, K=K, D=D, hasher=common, processes=None):
+        # unlike MTBDSState, there are no nextstates that are built step by
+        # step; the next trees come from build_state as a whole
+        self.H = H
+        self.K = K
+        self.D = D
+        self.hasher = hasher
+        self.currstates = [BDSState(H, K, hasher) for _ in range(D)]
+        self.pool = None
+        if processes != 0:
+            if hasher is not common:
+                raise ValueError("Worker processes need the default hasher")
+            self.pool = ProcessPoolExecutor(processes, **common.pool_options())
+        self.futures = [self.submit() for _ in range(D)]
+
+    def submit(self):
+        if self.pool is None:
+            return None
+        return self.pool.submit(build_state, (self.H, self.K))
+
+    def next_tree(self, i):
+        """Returns the next tree of layer i, and starts building the one
+        after it. With processes=0, there is no pool, and the tree is built
+        here when it is needed."""
+        if self.futures[i] is None:
+            snapshot = build_state((self.H, self.K), self.hasher)
+        else:
+            snapshot = self.futures[i].result()
+        self.futures[i] = self.submit()
+        return loads(snapshot, self.hasher)[0]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def seek(self, s):
+        """Moves the current trees to leaf s, as MTBDSState.seek does; the
+        next trees are complete whenever they are swapped in, so they do
+        not depend on s."""
+        for i in range(self.D):
+            self.seek_current(i, s)
+        self.hasher.step(keygen=True)
+
+    def traverse(self, s):
+        H, K, D = self.H, self.K, self.D
+        needswap_upto = -1
+        updates = H - K >> 1
+        for i in range(D):
+            if not end_of_tree(s, H, i):
+                if i == needswap_upto+1:
+                    self.currstates[i].traverse((s >> (H*i)) & ((1 << H) - 1))
+                updates = self.currstates[i].update(updates)
+            else:
+                needswap_upto = i
+                self.currstates[i] = self.next_tree(i)
+                updates -= 1  # a scheme like XMSS^MT would spend 1 to link
+        self.hasher.step()
+
+
+if __name__ == "__main__":
+    H, K, D = 8, 4, 2
+    correct_root = recursive_hash(H)
+    for cls in [MTBDSState, ParallelMTBDSState]:
+        states = cls(H, K, D)
+        states.keygen_and_setup()
+        start = time.time()
+        for s in range(2 ** (D*H) - 1):
+            states.traverse(s)
+        print('{}: {:.1f}us per step'.format(
+            cls.__name__, (time.time() - start) / (2 ** (D*H) - 1) * 1e6))
+        for i, path in enumerate(states.authpaths()):
+            assert compute_root(H, (1 << H) - 1, path) == correct_root
+        if cls is ParallelMTBDSState:
+            states.close()
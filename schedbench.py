@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+
+import time
+import common
+from bdstraversal_mt_c_like import BDSState
+
+
+class NullHasher(object):
+    """Stands in for the hash functions, so that only the bookkeeping of the
+    traversal is timed."""
+
+    def leafcalc(self, j):
+        return bytes(common.N)
+
+    def g(self, v):
+        return v[:common.N]
+
+    def step(self, keygen=False):
+        pass
+
+
+def scan(state):
+    """Picks the instance to update by scanning all of them, as BDSState did
+    before it kept a LowIndex."""
+    H, K = state.H, state.K
+    l_min = H
+    h = None
+    for j in range(H - K):
+        if state.treehash[j].completed:
+            low = H
+        elif state.treehash[j].stackusage == 0:
+            low = j
+        else:
+            low = state.treehash[j].height()
+        if low < l_min:
+            h = j
+            l_min = low
+    return h
+
+
+def selection_time(H, K, steps):
+    """Returns the average time to select an instance by scanning and through
+    the index, over the updates of the first steps leaves."""
+    state = BDSState(H, K, NullHasher())
+    state.keygen_and_setup()
+    scanning = indexing = 0
+    count = 0
+    for s in range(steps):
+        state.traverse(s)
+        for _ in range((H - K) >> 1):
+            start = time.perf_counter()
+            h = scan(state)
+            middle = time.perf_counter()
+            assert state.index.lowest() == h
+            scanning += middle - start
+            indexing += time.perf_counter() - middle
+            count += 1
+            if h is None:
+                break
+            state.treehash[h].update()
+    return scanning / count, indexing / count
+
+
+if __name__ == "__main__":
+    K = 2
+    for H in range(10, 21, 2):
+        scanning, indexing = selection_time(H, K, (1 << 10) - 1)
+        print('H = {}: scan {:.2f}us, index {:.2f}us per selection'.format(
+            H, scanning * 1e6, indexing * 1e6))
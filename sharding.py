@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+import common
+from common import Node, g, compute_root
+from bdstraversal_mt_c_like import BDSState
+from snapshot import dumps, loads
+
+
+class OffsetHasher(object):
+    """Hasher for a subtree whose leaves start at offset in the whole tree."""
+
+    def __init__(self, offset, hasher=common):
+        self.offset = offset
+        self.hasher = hasher
+
+    def leafcalc(self, j):
+        return self.hasher.leafcalc(self.offset + j)
+
+    def g(self, v):
+        return self.hasher.g(v)
+
+    def step(self, keygen=False):
+        self.hasher.step(keygen)
+
+
+class Shard(object):
+    """Signs one subtree of a key of height H, i.e. the leaves start, ...,
+    stop - 1. The auth paths are those of the subtree's own BDSState, followed
+    by the top nodes that are the same for all of its leaves. A shard can be
+    sent to another process; its state then travels as a snapshot."""
+
+    def __init__(self, H, state, start, top):
+        self.H = H
+        self.state = state
+        self.start = start
+        self.stop = start + (1 << state.H)
+        self.top = top
+        self.leaf = start
+
+    def sign(self):
+        """Returns the next leaf index and its auth path."""
+        leaf = self.leaf
+        if leaf >= self.stop:
+            raise ValueError("All leaves of the shard have been used")
+        path = list(self.state.auth) + self.top
+        if leaf + 1 < self.stop:
+            self.state.traverse_and_update(leaf - self.start)
+        self.leaf += 1
+        return leaf, path
+
+    def __getstate__(self):
+        return {'H': self.H, 'state': dumps(self.state, self.leaf),
+                'start': self.start, 'top': self.top}
+
+    def __setstate__(self, d):
+        state, leaf = loads(d['state'], OffsetHasher(d['start']))
+        self.__init__(d['H'], state, d['start'], d['top'])
+        self.leaf = leaf
+
+
+class MTShard(object):
+    """Signs the leaves start, ..., stop - 1 of an MTBDSState. It is made from
+    a snapshot of the state after keygen, which is moved to start with seek
+    once the shard is used, i.e. in the process that signs with it."""
+
+    def __init__(self, snapshot, start, stop):
+        self.snapshot = snapshot
+        self.start = start
+        self.stop = stop
+        self.leaf = start
+        self.states = None
+
+    def sign(self):
+        """Returns the next leaf index and its auth paths."""
+        if self.states is None:
+            self.states, _ = loads(self.snapshot)
+            self.states.seek(self.start)
+        leaf = self.leaf
+        if leaf >= self.stop:
+            raise ValueError("All leaves of the shard have been used")
+        path = [list(auth) for auth in self.states.authpaths()]
+        if leaf + 1 < 1 << (self.states.D * self.states.H):
+            self.states.traverse(leaf)
+        self.leaf += 1
+        return leaf, path
+
+    def __getstate__(self):
+        if self.states is None:
+            return self.__dict__
+        raise ValueError("Only unused shards can be moved")
+
+
+def keygen_shard(args):
+    H, K, d, i = args
+    state = BDSState(H - d, K, OffsetHasher(i << (H - d)))
+    return state.keygen_and_setup().v, dumps(state, i << (H - d))
+
+
+def split(H, K, workers, processes=None):
+    """Splits a key of height H into workers subtrees, of which the states
+    are set up in a process pool. Returns the root and a Shard per subtree.
+    The number of workers has to be a power of 2, with (H - d - K) even for
+    d = log2(workers). Only the top d levels are computed here, once."""
+    d = workers.bit_length() - 1
+    assert workers == 1 << d and (H - d - K) % 2 == 0
+    with ProcessPoolExecutor(processes, **common.pool_options()) as pool:
+        results = list(pool.map(keygen_shard, [
+            (H, K, d, i) for i in range(workers)]))
+    levels = [[v for v, _ in results]]
+    for _ in range(d):
+        level = levels[-1]
+        levels.append([g(level[i] + level[i + 1])
+                       for i in range(0, len(level), 2)])
+    shards = []
+    for i, (_, snapshot) in enumerate(results):
+        state, start = loads(snapshot, OffsetHasher(i << (H - d)))
+        top = [Node(h=H - d + h, v=levels[h][(i >> h) ^ 1]) for h in range(d)]
+        shards.append(Shard(H, state, start, top))
+    return Node(h=H, v=levels[d][0]), shards
+
+
+def split_mt(states, workers):
+    """Splits the leaves of an MTBDSState that has been set up into workers
+    consecutive ranges, and returns an MTShard per range."""
+    snapshot = dumps(states, 0)
+    leaves = 1 << (states.D * states.H)
+    bounds = [i * leaves // workers for i in range(workers + 1)]
+    return [MTShard(snapshot, bounds[i], bounds[i + 1])
+            for i in range(workers)]
+
+
+def sign_all(shard):
+    """Signs with a shard until it runs out, and returns the last path."""
+    for _ in range(shard.start, shard.stop):
+        leaf, path = shard.sign()
+    return leaf, path
+
+
+if __name__ == "__main__":
+    H = 14
+    for workers in [1, 2, 4, 8]:
+        d = workers.bit_length() - 1
+        start = time.time()
+        root, shards = split(H, 4 - d % 2, workers)  # keeps H - d - K even
+        with ProcessPoolExecutor(workers, **common.pool_options()) as pool:
+            for leaf, path in pool.map(sign_all, shards):
+                assert compute_root(H, leaf, path) == root.v
+        print('{} workers: {:.0f} leaves/s, including keygen'.format(
+            workers, (1 << H) / (time.time() - start)))
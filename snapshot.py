@@ -0,0 +1,212 @@
+#! /usr/bin/env python
+
+import os
+import mmap
+import struct
+import tempfile
+import common
+from common import Node, recursive_hash, compute_root
+from bdstraversal_mt_c_like import BDSState, MTBDSState, H
+
+# A snapshot consists of a header, followed by one or more BDSStates. Within a
+# state, every node is stored as a height byte and a value of N bytes, where
+# the height EMPTY marks a missing node (i.e. None).
+MAGIC = b'MTTS'
+VERSION = 2
+# magic, version, kind, H, K, D, N, leaf, name of the hash function
+HEADER = struct.Struct('<4sBBBBBBQ16s')
+TREEHASH = struct.Struct('<QBB')  # next_idx, completed, stackusage
+COUNT = struct.Struct('<Q')
+EMPTY = 0xff
+KINDS = [BDSState, MTBDSState]  # and kind 2, see kinds()
+
+
+def kinds():
+    """Returns the state classes by kind. A ParallelMTBDSState is stored
+    without next trees, as its workers build them as a whole."""
+    from parallelmt import ParallelMTBDSState  # which imports this module
+    return KINDS + [ParallelMTBDSState]
+
+
+def dump_node(out, node):
+    if node is None:
+        out.append(bytes([EMPTY]) + bytes(common.N))
+    else:
+        out.append(bytes([node.h]) + node.v)
+
+
+def dump_state(out, state):
+    out.append(COUNT.pack(state.nextidx))
+    out.append(COUNT.pack(len(state.stack)))
+    for node in state.stack + state.auth + state.keep + state.retain:
+        dump_node(out, node)
+    for th in state.treehash:
+        out.append(TREEHASH.pack(th.next_idx, th.completed, th.stackusage))
+        dump_node(out, th.node)
+
+
+def dumps(state, leaf):
+    """Serializes a BDSState or MTBDSState, together with the index of the
+    next leaf that it will produce an authentication path for."""
+    kind = kinds().index(type(state))
+    d = state.D if kind else 1
+    out = [HEADER.pack(MAGIC, VERSION, kind, state.H, state.K, d, common.N,
+                       leaf, common.HASH.encode())]
+    if kind == 0:
+        dump_state(out, state)
+    elif kind == 1:
+        for s in state.currstates + state.nextstates:
+            dump_state(out, s)
+    else:
+        for s in state.currstates:
+            dump_state(out, s)
+    return b''.join(out)
+
+
+class Reader(object):
+    """Parses a snapshot from any buffer, e.g. a memory-mapped file."""
+
+    def __init__(self, buf, offset=0):
+        self.buf = buf
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.buf, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def node(self):
+        h = self.buf[self.offset]
+        v = self.buf[self.offset + 1:self.offset + 1 + common.N]
+        self.offset += 1 + common.N
+        return None if h == EMPTY else Node(h=h, v=bytes(v))
+
+    def nodes(self, count):
+        return [self.node() for _ in range(count)]
+
+    def state(self, H, K, hasher):
+        state = BDSState(H, K, hasher)
+        state.nextidx, = self.unpack(COUNT)
+        stacksize, = self.unpack(COUNT)
+        state.stack.extend(self.nodes(stacksize))  # Treehash shares the list
+        state.auth = self.nodes(len(state.auth))
+        state.keep = self.nodes(len(state.keep))
+        state.retain = self.nodes(len(state.retain))
+        for th in state.treehash:
+            th.next_idx, completed, th.stackusage = self.unpack(TREEHASH)
+            th.completed = bool(completed)
+            th.node = self.node()
+        # an instance's nodes lie below those of the smaller instances that
+        # were updated since, and its lowest node is on top of its own part
+        top = len(state.stack)
+        for th in state.treehash:
+            if th.completed:
+                state.index.set(th.h, None)
+            elif th.stackusage:
+                state.index.set(th.h, state.stack[top - 1].h)
+                top -= th.stackusage
+            else:
+                state.index.set(th.h, th.h)
+        return state
+
+
+def loads(buf, hasher=common):
+    """Restores a state from a snapshot. Returns the state and the leaf."""
+    reader = Reader(buf)
+    magic, version, kind, h, k, d, n, leaf, name = reader.unpack(HEADER)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a version {} state snapshot".format(VERSION))
+    if n != common.N:
+        raise ValueError("Snapshot node size does not match N")
+    if name.rstrip(b'\0') != common.HASH.encode():
+        raise ValueError("Snapshot hash function does not match HASH")
+    if kind == 0:
+        return reader.state(h, k, hasher), leaf
+    if kind == 1:
+        state = MTBDSState(h, k, d, hasher)
+    else:
+        state = kinds()[kind](h, k, d, hasher, processes=0)
+    state.currstates = [reader.state(h, k, hasher) for _ in range(d)]
+    if kind == 1:
+        state.nextstates = [reader.state(h, k, hasher) for _ in range(d)]
+    return state, leaf
+
+
+def save(path, state, leaf):
+    """Atomically replaces the snapshot at path; after a crash, either the
+    old or the new snapshot is found there, but never a partial one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dumps(state, leaf))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    if hasattr(os, 'O_DIRECTORY'):  # make the rename itself durable
+        dirfd = os.open(directory, os.O_DIRECTORY)
+        try:
+            os.fsync(dirfd)
+        finally:
+            os.close(dirfd)
+
+
+def load(path, hasher=common):
+    """Restores a state from a snapshot file by memory-mapping it."""
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return loads(buf, hasher)
+
+
+class PersistentState(object):
+    """Wraps a BDSState or MTBDSState so that the state is persisted after
+    every traversal step, before the authentication path is handed out. A
+    leaf index is therefore never handed out twice, even after a crash."""
+
+    def __init__(self, path, state, leaf=0):
+        self.path = path
+        self.state = state
+        self.leaf = leaf
+
+    @classmethod
+    def resume(cls, path, hasher=common):
+        state, leaf = load(path, hasher)
+        return cls(path, state, leaf)
+
+    def authpath(self):
+        """Returns the next leaf index and its auth path(s)."""
+        leaf = self.leaf
+        if isinstance(self.state, MTBDSState):
+            leaves = 1 << (self.state.D * self.state.H)
+        else:
+            leaves = 1 << self.state.H
+        if leaf >= leaves:
+            raise ValueError("All leaves have been used")
+        if isinstance(self.state, MTBDSState):
+            path = [list(auth) for auth in self.state.authpaths()]
+            if leaf + 1 < leaves:
+                self.state.traverse(leaf)
+        else:
+            path = list(self.state.auth)
+            if leaf + 1 < leaves:
+                self.state.traverse_and_update(leaf)
+        self.leaf = leaf + 1
+        save(self.path, self.state, self.leaf)
+        return leaf, path
+
+
+if __name__ == "__main__":
+    correct_root = recursive_hash(H)
+    path = os.path.join(tempfile.mkdtemp(), 'state')
+    state = BDSState()
+    state.keygen_and_setup()
+    signer = PersistentState(path, state)
+    for _ in range(1 << H):
+        leaf, auth = signer.authpath()
+        print('leaf {}: {}'.format(leaf, compute_root(H, leaf, auth) ==
+                                   correct_root))
+        signer = PersistentState.resume(path)  # as if the signer restarted
+    print('snapshot size: {} bytes'.format(os.path.getsize(path)))
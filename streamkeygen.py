@@ -0,0 +1,121 @@
+#! /usr/bin/env python
+
+import os
+import mmap
+import time
+import tempfile
+from itertools import islice
+import common
+from common import leafcalc, recursive_hash, compute_root
+from bdstraversal_mt_c_like import BDSState
+from snapshot import save, load
+
+
+def chunks(leaves, size=1 << 16):
+    """Groups an iterator of leaf values into lists of size leaves."""
+    leaves = iter(leaves)
+    while True:
+        chunk = list(islice(leaves, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def file_leaves(path, start=0, size=1 << 16):
+    """Yields chunks of leaf values from a memory-mapped file of concatenated
+    N-byte leaves, starting at leaf start."""
+    n = common.N
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for offset in range(start * n, len(buf), size * n):
+                end = min(len(buf), offset + size * n)
+                yield [buf[i:i + n] for i in range(offset, end, n)]
+
+
+class FileLeaves(object):
+    """Hasher that serves the leaves from a memory-mapped file of concatenated
+    N-byte leaves, so that traversal and compute_root use the same leaves as
+    a keygen that streamed them from that file. Other hash calls are passed
+    on to hasher."""
+
+    def __init__(self, path, hasher=common):
+        self.hasher = hasher
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def leafcalc(self, j):
+        n = common.N
+        return self.buf[j * n:(j + 1) * n]
+
+    def g(self, v):
+        return self.hasher.g(v)
+
+    def step(self, keygen=False):
+        self.hasher.step(keygen)
+
+    def close(self):
+        self.buf.close()
+
+
+def report(done, total, rate):
+    print('{}/{} leaves ({:.1f}%), {:.0f} leaves/s'.format(
+        done, total, 100 * done / total, rate))
+
+
+def stream_keygen(state, source, checkpoint=None, progress=None):
+    """Sets up a BDSState from chunks of leaf values, which start at leaf
+    state.nextidx. Only the O(H) shared stack and the nodes that the state
+    keeps are held in memory. After every chunk, the partial state can be
+    saved as a snapshot to checkpoint, from which resume() continues.
+
+    Traversal computes leaves with state.hasher, which therefore has to give
+    the streamed values, e.g. a FileLeaves on the same file. The first leaf
+    of every chunk is checked against it."""
+    total = 1 << state.H
+    start, done = time.time(), state.nextidx
+    for chunk in source:
+        if chunk and chunk[0] != state.hasher.leafcalc(state.nextidx):
+            raise ValueError("Leaf {} does not match state.hasher"
+                             .format(state.nextidx))
+        for leaf in chunk:
+            state.stack_update(state.nextidx, leaf)
+            state.nextidx += 1
+        if checkpoint is not None:
+            save(checkpoint, state, 0)
+        if progress is not None:
+            rate = (state.nextidx - done) / max(time.time() - start, 1e-9)
+            progress(state.nextidx, total, rate)
+    if state.nextidx != total:
+        raise ValueError("The leaf source ended after {} of {} leaves"
+                         .format(state.nextidx, total))
+    state.nextidx = 0
+    state.hasher.step(keygen=True)
+    return state.stack.pop()
+
+
+def resume(checkpoint, hasher=common):
+    """Loads a partial state from a checkpoint; its nextidx is the first leaf
+    that still has to be streamed."""
+    state, _ = load(checkpoint, hasher)
+    return state
+
+
+if __name__ == "__main__":
+    H, K = 16, 4
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'leaves')
+    checkpoint = os.path.join(directory, 'checkpoint')
+    with open(path, 'wb') as f:
+        for j in range(1 << H):
+            f.write(leafcalc(j))
+    leaves = FileLeaves(path)
+    state = BDSState(H, K, leaves)
+    try:  # simulate an interrupted run
+        stream_keygen(state, islice(file_leaves(path), 5), checkpoint, report)
+    except ValueError as e:
+        print(e)
+    state = resume(checkpoint, leaves)
+    root = stream_keygen(state, file_leaves(path, state.nextidx), checkpoint,
+                         report)
+    print('root: {}'.format(root.v == recursive_hash(H)))
+    print('leaf 0: {}'.format(compute_root(H, 0, state.auth) == root.v))
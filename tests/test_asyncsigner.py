@@ -0,0 +1,63 @@
+import asyncio
+from common import recursive_hash, compute_root
+from bdstraversal_mt_c_like import BDSState, MTBDSState
+from asyncsigner import AsyncSigner
+
+
+def sign_all(signer, count):
+    async def requests():
+        results = await asyncio.gather(*[signer.sign() for _ in range(count)])
+        await signer.close()
+        return results
+    return asyncio.run(requests())
+
+
+def test_async_signer():
+    H, K, D = 4, 2, 2
+    correct_root = recursive_hash(H)
+    states = MTBDSState(H, K, D)
+    states.keygen_and_setup()
+    signer = AsyncSigner(states)
+    results = sign_all(signer, 2 ** (D*H))
+    assert [leaf for leaf, paths in results] == list(range(2 ** (D*H)))
+    for leaf, paths in results:
+        for i, path in enumerate(paths):
+            idx = (leaf >> (H*i)) & ((1 << H) - 1)
+            assert compute_root(H, idx, path) == correct_root
+    assert signer.stats()['signatures'] == 2 ** (D*H)
+
+
+def test_async_signer_state():
+    H, K = 6, 2
+    correct_root = recursive_hash(H)
+    state = BDSState(H, K)
+    state.keygen_and_setup()
+    signer = AsyncSigner(state)
+    for leaf, path in sign_all(signer, 2 ** H):
+        assert compute_root(H, leaf, path) == correct_root
+
+
+def test_async_signer_failure():
+    H, K = 4, 2
+    state = BDSState(H, K)
+    state.keygen_and_setup()
+    signer = AsyncSigner(state)
+    assert signer.stats() == {'signatures': 0, 'p50': None, 'p99': None}
+    step = signer.step
+
+    def failing(s):
+        step(s)
+        if s == 0:
+            raise ZeroDivisionError
+
+    async def requests():
+        await signer.sign()
+        for request in [signer.sign, signer.sign, signer.close]:
+            try:
+                await request()
+                assert False
+            except ZeroDivisionError:
+                pass
+    signer.step = failing
+    asyncio.run(requests())
+    assert signer.leaf == 1
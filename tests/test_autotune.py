@@ -0,0 +1,42 @@
+from common import CostCounter, recursive_hash, compute_root
+from bdstraversal_mt_c_like import MTBDSState
+from autotune import Plan, configurations, step_cost, plan, build
+
+
+def test_configurations():
+    for H, K, D in configurations(2 ** 12):
+        assert H * D >= 12 and K >= 2 and (H - K) % 2 == 0
+        assert D == 1 or (H - K) // 2 >= D - 1
+
+
+def test_step_cost_bound():
+    for H, K, D in [(6, 2, 1), (8, 4, 1), (8, 2, 1), (4, 2, 2), (6, 2, 2)]:
+        counter = CostCounter()
+        state = build(Plan(H, K, D, None, None, None), counter)
+        state.keygen_and_setup()
+        step = getattr(state, 'traverse_and_update', state.traverse)
+        for s in range(2 ** (H*D) - 1):
+            step(s)
+        assert counter.worst <= step_cost(H, K, D)
+
+
+def test_plan():
+    p = plan(2 ** 8, 4096, 20)
+    assert p.H * p.D >= 8 and p.memory <= 4096 and p.hashes <= 20
+    state = build(p)
+    root = state.keygen_and_setup()
+    assert root.v == recursive_hash(p.H)
+    if isinstance(state, MTBDSState):
+        assert compute_root(p.H, 0, state.authpaths()[0]) == root.v
+    else:
+        assert compute_root(p.H, 0, state.auth) == root.v
+    try:
+        plan(2 ** 8, 10, 20)
+        assert False
+    except ValueError:
+        pass
+    try:
+        plan(2 ** 8, 2 ** 16)
+        assert False
+    except ValueError:
+        pass
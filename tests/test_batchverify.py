@@ -0,0 +1,39 @@
+from common import Node, recursive_hash
+from bdstraversal_mt_c_like import BDSState
+from batchverify import verify_batch
+
+
+def test_verify_batch():
+    H, K = 6, 2
+    root = recursive_hash(H)
+    state = BDSState(H, K)
+    state.keygen_and_setup()
+    items = [(0, list(state.auth))]
+    for s in range(2 ** H - 1):
+        items.append((s + 1, list(state.traverse_and_update(s))))
+    assert verify_batch(H, root, items) == [True] * 2 ** H
+    path = list(items[9][1])
+    path[3] = Node(h=3, v=bytes(32))
+    items[9] = (9, path)
+    items[20] = (21, items[20][1])
+    expected = [i not in (9, 20) for i in range(2 ** H)]
+    assert verify_batch(H, root, items) == expected
+    assert verify_batch(H, root, items, processes=2) == expected
+    assert verify_batch(H, root, [], processes=2) == []
+    assert verify_batch(H, root, []) == []
+
+
+def test_pool_options():
+    import common
+    H, K = 4, 2
+    try:
+        common.use_hash('sha512', 24)  # the workers have to select it too
+        root = recursive_hash(H)
+        state = BDSState(H, K)
+        state.keygen_and_setup()
+        items = [(0, list(state.auth))]
+        for s in range(2 ** H - 1):
+            items.append((s + 1, list(state.traverse_and_update(s))))
+        assert verify_batch(H, root, items, processes=2) == [True] * 2 ** H
+    finally:
+        common.use_hash('sha256')
@@ -2,21 +2,72 @@ from common import recursive_hash, compute_root
 
 
 def test_traversal():
-    from bdstraversal import traverse, H, AUTH, keygen_and_setup
+    from bdstraversal import BDSState, H
     correct_root = recursive_hash(H)
-    keygen_and_setup()
-    assert compute_root(H, 0, AUTH) == correct_root
+    state = BDSState()
+    state.keygen_and_setup()
+    assert compute_root(H, 0, state.auth) == correct_root
     for s in range(2 ** H - 1):
-        assert compute_root(H, s + 1, traverse(s)) == correct_root
+        assert compute_root(H, s + 1, state.traverse(s)) == correct_root
 
 
 def test_traversal_clike():
-    from bdstraversal_c_like import traverse, H, AUTH, keygen_and_setup
+    from bdstraversal_c_like import BDSState, H
     correct_root = recursive_hash(H)
-    keygen_and_setup()
-    assert compute_root(H, 0, AUTH) == correct_root
+    state = BDSState()
+    state.keygen_and_setup()
+    assert compute_root(H, 0, state.auth) == correct_root
     for s in range(2 ** H - 1):
-        assert compute_root(H, s + 1, traverse(s)) == correct_root
+        assert compute_root(H, s + 1, state.traverse(s)) == correct_root
+
+
+def test_classic_and_log_traversal():
+    from classictraversal import ClassicState, H
+    from logtraversal import LogState
+    correct_root = recursive_hash(H)
+    for state in [ClassicState(), LogState()]:
+        state.keygen_and_setup()
+        for s in range(2 ** H):
+            assert compute_root(H, s, state.traverse(s)) == correct_root
+
+
+def test_fractal_traversal():
+    from fractaltraversal import FractalState
+    H = 6
+    correct_root = recursive_hash(H)
+    for h in [1, 2, 3, 6]:
+        state = FractalState(H, h)
+        assert state.keygen_and_setup().v == correct_root
+        assert compute_root(H, 0, state.auth) == correct_root
+        for s in range(2 ** H - 1):
+            assert compute_root(H, s + 1, state.traverse(s)) == correct_root
+
+
+def test_concurrent_instances():
+    import bdstraversal
+    import bdstraversal_c_like
+    import bdstraversal_mt_c_like
+    import bdstraversal_compact
+    from classictraversal import ClassicState
+    from logtraversal import LogState
+    states = [ClassicState(5), LogState(3)]
+    for module in [bdstraversal, bdstraversal_c_like, bdstraversal_mt_c_like,
+                   bdstraversal_compact]:
+        states += [module.BDSState(6, 2), module.BDSState(6, 4)]
+    for state in states:
+        state.keygen_and_setup()
+    roots = [recursive_hash(state.H) for state in states]
+    for s in range(2 ** 6):
+        for state, root in zip(states, roots):
+            if isinstance(state, ClassicState):
+                if s < 2 ** state.H:
+                    assert compute_root(state.H, s, state.traverse(s)) == root
+            elif s + 1 < 2 ** state.H:
+                if hasattr(state, 'traverse_and_update'):
+                    auth = state.traverse_and_update(s)
+                else:
+                    auth = state.traverse(s)
+                assert compute_root(state.H, s + 1, auth) == root
 
 
 def test_state_traversal():
@@ -31,9 +82,14 @@ def test_state_traversal():
 
 
 def test_mt_state_traversal():
-    from bdstraversal_mt_c_like import MTBDSState, H, D
+    from bdstraversal_mt_c_like import MTBDSState
+    for H, K, D in [(4, 2, 3), (6, 2, 2)]:
+        check_mt_state_traversal(MTBDSState(H, K, D))
+
+
+def check_mt_state_traversal(states):
+    H, D = states.H, states.D
     correct_root = recursive_hash(H)
-    states = MTBDSState()
     states.keygen_and_setup()
     for s in range(2 ** (D*H)):
         authpaths = states.authpaths()
@@ -42,3 +98,220 @@ def test_mt_state_traversal():
             assert compute_root(H, idx, path) == correct_root
         if s + 1 < 2 ** (D*H):
             states.traverse(s)
+
+
+def test_batched_treehash():
+    from common import treehash
+    for h in range(6):
+        assert treehash(h, batched=True) == treehash(h)
+    assert treehash(8, batched=True).v == recursive_hash(8)
+
+
+def test_hash_providers():
+    import common
+    from bdstraversal_mt_c_like import BDSState, H
+    try:
+        for name in common.HASHES:
+            common.use_hash(name, 24)
+            assert len(common.g(b'')) == 24
+            correct_root = recursive_hash(H)
+            state = BDSState()
+            assert state.keygen_and_setup().v == correct_root
+            for s in range(2 ** H - 1):
+                auth = state.traverse_and_update(s)
+                assert compute_root(H, s + 1, auth) == correct_root
+        for name, n in [('sha256', 64), ('sha512', 65)]:
+            try:
+                common.use_hash(name, n)
+                assert False
+            except ValueError:
+                pass
+        assert common.N == 24 and len(common.g(b'')) == 24
+    finally:
+        common.use_hash('sha256')
+
+
+def test_cost_counter():
+    from common import CostCounter
+    from bdstraversal_mt_c_like import BDSState, H, K
+    counters = [CostCounter(), CostCounter()]
+    states = [BDSState(hasher=counter) for counter in counters]
+    for state in states:
+        state.keygen_and_setup()
+    for s in range(2 ** H - 1):
+        states[0].traverse_and_update(s)
+    assert counters[0].keygen == counters[1].keygen == 2 ** (H + 1) - 1
+    assert counters[0].steps == 2 ** H - 1 and counters[1].steps == 0
+    assert counters[0].worst_leaves <= ((H - K) >> 1) + 1
+    assert 0 < counters[0].average() <= counters[0].worst
+    assert counters[0].export()['worst'] == counters[0].worst
+
+
+def test_compact_state_traversal():
+    from bdstraversal_compact import BDSState, H
+    import bdstraversal_mt_c_like
+    correct_root = recursive_hash(H)
+    state = BDSState()
+    reference = bdstraversal_mt_c_like.BDSState()
+    assert state.keygen_and_setup().v == correct_root
+    reference.keygen_and_setup()
+    assert compute_root(H, 0, state.auth) == correct_root
+    for s in range(2 ** H - 1):
+        auth = state.traverse_and_update(s)
+        assert compute_root(H, s + 1, auth) == correct_root
+        refauth = reference.traverse_and_update(s)
+        assert [node.v for node in auth] == [node.v for node in refauth]
+
+
+def test_compact_state_without_treehash():
+    from bdstraversal_compact import BDSState
+    for H in [2, 4, 6]:
+        correct_root = recursive_hash(H)
+        state = BDSState(H, H)
+        assert state.keygen_and_setup().v == correct_root
+        for s in range(2 ** H - 1):
+            auth = state.traverse_and_update(s)
+            assert compute_root(H, s + 1, auth) == correct_root
+
+
+def test_traverse_range():
+    from common import read_path
+    import bdstraversal
+    import bdstraversal_c_like
+    import bdstraversal_mt_c_like
+    import bdstraversal_compact
+    from classictraversal import ClassicState
+    from logtraversal import LogState
+    H = 6
+    correct_root = recursive_hash(H)
+    for state in [ClassicState(H), LogState(H)]:
+        state.keygen_and_setup()
+        buf = bytearray(5 * H * 32)
+        assert state.traverse_range(0, 5, buf) is buf
+        buf += state.traverse_range(5, 2 ** H - 5)
+        for s in range(2 ** H):
+            assert compute_root(H, s, read_path(buf, H, s)) == correct_root
+    for module in [bdstraversal, bdstraversal_c_like, bdstraversal_mt_c_like,
+                   bdstraversal_compact]:
+        state = module.BDSState(H, 2)
+        state.keygen_and_setup()
+        buf = state.traverse_range(0, 7) + state.traverse_range(7, 2 ** H - 8)
+        for s in range(2 ** H - 1):
+            path = read_path(buf, H, s)
+            assert compute_root(H, s + 1, path) == correct_root
+
+
+def test_top_cache():
+    from common import Node, TopCache, CostCounter
+    from bdstraversal_mt_c_like import BDSState
+    H, K = 6, 2
+    correct_root = recursive_hash(H)
+    cache = TopCache(H, 3)
+    state = BDSState(H, K, cache=cache)
+    state.keygen_and_setup()
+    assert cache.root == correct_root and len(cache.nodes) == 8 + 4 + 2
+    for s in range(2 ** H - 1):
+        auth = state.traverse_and_update(s)
+        assert compute_root(H, s + 1, auth, cache) == correct_root
+    assert cache.hits > 0
+
+    cache = TopCache(H, 2, maxsize=4)
+    cache.add(H, 0, correct_root)
+    state = BDSState(H, K)
+    state.keygen_and_setup()
+    counter = CostCounter()
+    assert compute_root(H, 0, state.auth, cache, counter) == correct_root
+    assert counter.nodes == H and len(cache.nodes) == 4
+    auth = state.traverse(0)
+    assert compute_root(H, 1, auth, cache, counter) == correct_root
+    assert counter.nodes == 2 * H - 2
+    bad = list(state.auth)
+    bad[0] = Node(h=0, v=bytes(32))
+    assert compute_root(H, 1, bad, cache) != correct_root
+
+
+def test_low_index():
+    from common import LowIndex
+    from schedbench import scan
+    from bdstraversal_mt_c_like import BDSState
+    index = LowIndex(4)
+    assert index.lowest() is None
+    index.set(3, 1)
+    index.set(2, 1)
+    index.set(0, 2)
+    assert index.lowest() == 2
+    index.set(2, None)
+    assert index.lowest() == 3
+    H, K = 8, 2
+    state = BDSState(H, K)
+    state.keygen_and_setup()
+    for s in range((1 << H) - 1):
+        state.traverse(s)
+        for _ in range((H - K) >> 1):
+            assert state.index.lowest() == scan(state)
+            state.update(1)
+
+
+def test_seek():
+    from common import TopCache
+    from bdstraversal_mt_c_like import BDSState
+    from snapshot import dumps
+    for H, K, cache in [(6, 2, False), (7, 3, True), (8, 4, False)]:
+        def factory():
+            state = BDSState(H, K, cache=TopCache(H, K) if cache else None)
+            state.keygen_and_setup()
+            return state
+        state = factory()
+        sought = factory()
+        for s in range(2 ** H):
+            if s > 0:
+                state.traverse_and_update(s - 1)
+            sought.seek(s)
+            assert dumps(sought, s) == dumps(state, s)
+
+
+def test_mt_seek():
+    from bdstraversal_mt_c_like import MTBDSState
+    from snapshot import dumps
+    H, K, D = 4, 2, 3
+    states = MTBDSState(H, K, D)
+    states.keygen_and_setup()
+    stepped = []
+    paths = []
+    for s in range(2 ** (D*H)):
+        stepped.append((dumps(states.currstates[0], 0),
+                        [state.nextidx for state in states.nextstates]))
+        paths.append([list(auth) for auth in states.authpaths()])
+        if s + 1 < 2 ** (D*H):
+            states.traverse(s)
+    for s in [0, 1, 15, 16, 17, 37, 255, 256, 1000, 2 ** (D*H) - 1]:
+        states = MTBDSState(H, K, D)
+        states.keygen_and_setup()
+        states.seek(s)
+        lowest, nextidx = stepped[s]
+        assert dumps(states.currstates[0], 0) == lowest
+        assert all(state.nextidx >= idx
+                   for state, idx in zip(states.nextstates, nextidx))
+        assert [list(auth) for auth in states.authpaths()] == paths[s]
+        for t in range(s, 2 ** (D*H) - 1):
+            states.traverse(t)
+            assert [list(auth) for auth in states.authpaths()] == paths[t + 1]
+
+
+def test_leaf_cache():
+    from common import LeafCache, CostCounter
+    from bdstraversal_mt_c_like import BDSState
+    H, K = 6, 2
+    correct_root = recursive_hash(H)
+    for evict in ['lru', 'ahead']:
+        counter = CostCounter()
+        cache = LeafCache(8, counter, evict)
+        state = BDSState(H, K, cache)
+        assert state.keygen_and_setup().v == correct_root
+        for s in range(2 ** H - 1):
+            auth = state.traverse_and_update(s)
+            assert compute_root(H, s + 1, auth, hasher=cache) == correct_root
+            assert len(cache.values) <= 8
+        assert cache.misses == counter.leaves
+        assert cache.hits > 0
+        assert counter.steps == 2 ** H - 1
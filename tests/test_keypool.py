@@ -0,0 +1,72 @@
+import tempfile
+from common import recursive_hash, compute_root
+from bdstraversal_mt_c_like import BDSState, MTBDSState
+from snapshot import load
+from keypool import KeyPool
+
+
+def test_key_pool():
+    H, K, D = 4, 2, 2
+    correct_root = recursive_hash(H)
+    pool = KeyPool(tempfile.mkdtemp(), resident=2, processes=2)
+    for key in ['a', 'b', 'c']:
+        state = BDSState(H, K)
+        state.keygen_and_setup()
+        pool.add(key, state)
+    states = MTBDSState(H, K, D)
+    states.keygen_and_setup()
+    pool.add('mt', states)
+    for s in range(2 ** H):
+        for key in ['a', 'b', 'c']:
+            leaf, path = pool.sign(key)
+            assert leaf == s
+            assert compute_root(H, leaf, path) == correct_root
+    for s in range(2 ** (D*H)):
+        leaf, paths = pool.sign('mt')
+        assert leaf == s
+        for i, path in enumerate(paths):
+            idx = (leaf >> (H*i)) & ((1 << H) - 1)
+            assert compute_root(H, idx, path) == correct_root
+    try:
+        pool.sign('a')
+        assert False
+    except ValueError:
+        pass
+    stats = pool.stats()
+    assert stats['signatures'] == 3 * 2 ** H + 2 ** (D*H)
+    assert stats['resident'] <= 2
+    assert pool.metrics['a']['spills'] > 0
+    assert pool.metrics['a']['loads'] > 0
+    pool.close()
+    for key, leaf in [('a', 2 ** H), ('mt', 2 ** (D*H))]:
+        assert load(pool.paths[key])[1] == leaf
+
+
+def test_key_pool_nothing_resident():
+    H, K = 4, 2
+    correct_root = recursive_hash(H)
+    pool = KeyPool(tempfile.mkdtemp(), resident=0, processes=1)
+    for key in ['a', 'b']:
+        state = BDSState(H, K)
+        state.keygen_and_setup()
+        pool.add(key, state)
+    for s in range(2 ** H):
+        for key in ['a', 'b']:
+            leaf, path = pool.sign(key)
+            assert leaf == s
+            assert compute_root(H, leaf, path) == correct_root
+            assert pool.stats()['resident'] <= 1
+    pool.close()
+
+
+def test_key_pool_hasher():
+    from sharding import OffsetHasher
+    pool = KeyPool(tempfile.mkdtemp(), processes=1)
+    state = BDSState(4, 2, OffsetHasher(16))
+    state.keygen_and_setup()
+    try:
+        pool.add('a', state)
+        assert False
+    except ValueError:
+        pass
+    pool.close()
@@ -0,0 +1,40 @@
+import os
+import tempfile
+from common import recursive_hash, compute_root
+from bdstraversal_mt_c_like import BDSState
+from nodeindex import every, build, NodeIndex
+
+
+def test_node_index():
+    H, K = 6, 2
+    correct_root = recursive_hash(H)
+    state = BDSState(H, K)
+    state.keygen_and_setup()
+    paths = [list(state.auth)]
+    for s in range(2 ** H - 1):
+        paths.append(list(state.traverse_and_update(s)))
+    path = os.path.join(tempfile.mkdtemp(), 'index')
+    for levels in [every(H, 1), every(H, 2, 1), every(H, 4), [], [H]]:
+        assert build(path, H, levels).v == correct_root
+        index = NodeIndex(path)
+        assert index.levels == sorted(levels)
+        for idx in reversed(range(2 ** H)):
+            authpath = index.authpath(idx)
+            assert [n.v for n in authpath] == [n.v for n in paths[idx]]
+            assert compute_root(H, idx, authpath) == correct_root
+        index.close()
+
+
+def test_node_index_hash_function():
+    import common
+    path = os.path.join(tempfile.mkdtemp(), 'index')
+    build(path, 4, every(4, 1))
+    try:
+        common.use_hash('sha512', 32)
+        NodeIndex(path)
+        assert False
+    except ValueError:
+        pass
+    finally:
+        common.use_hash('sha256')
+    NodeIndex(path).close()
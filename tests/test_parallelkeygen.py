@@ -0,0 +1,70 @@
+from common import recursive_hash
+
+
+def test_keygen_classic():
+    from classictraversal import ClassicState
+    from parallelkeygen import keygen_classic
+    serial, parallel = ClassicState(), ClassicState()
+    root = serial.keygen_and_setup()
+    assert keygen_classic(parallel, 3, processes=2) == root
+    assert parallel.auth == serial.auth
+    assert ([th.stack for th in parallel.treehash] ==
+            [th.stack for th in serial.treehash])
+
+
+def test_keygen_bds():
+    from bdstraversal import BDSState
+    from parallelkeygen import keygen_bds
+    serial, parallel = BDSState(), BDSState()
+    root = serial.keygen_and_setup()
+    assert keygen_bds(parallel, 2, processes=2) == root
+    assert parallel.auth == serial.auth
+    assert ([th.node for th in parallel.treehash] ==
+            [th.node for th in serial.treehash])
+    assert parallel.retain == serial.retain
+
+
+def test_keygen_bds_c_like():
+    from bdstraversal_c_like import BDSState
+    from parallelkeygen import keygen_state
+    serial, parallel = BDSState(), BDSState()
+    root = serial.keygen_and_setup()
+    assert keygen_state(parallel, 4, processes=1) == root
+    assert parallel.auth == serial.auth
+    assert ([th.node for th in parallel.treehash] ==
+            [th.node for th in serial.treehash])
+    assert parallel.retain == serial.retain
+
+
+def test_keygen_state():
+    from bdstraversal_mt_c_like import BDSState, H
+    from parallelkeygen import keygen_state
+    serial, parallel = BDSState(), BDSState()
+    root = serial.keygen_and_setup()
+    assert keygen_state(parallel, 2) == root
+    assert root.v == recursive_hash(H)
+    assert parallel.auth == serial.auth
+    assert parallel.retain == serial.retain
+    assert parallel.stack == serial.stack == []
+    assert ([th.node for th in parallel.treehash] ==
+            [th.node for th in serial.treehash])
+
+
+def test_keygen_hasher():
+    from common import CostCounter
+    from bdstraversal_mt_c_like import BDSState
+    from parallelkeygen import keygen_state
+    from sharding import OffsetHasher
+    for serial, parallel in [(OffsetHasher(64), OffsetHasher(64)),
+                             (CostCounter(), CostCounter())]:
+        serial, parallel = BDSState(6, 2, serial), BDSState(6, 2, parallel)
+        root = serial.keygen_and_setup()
+        assert keygen_state(parallel, 2, processes=1) == root
+        assert parallel.auth == serial.auth
+        assert parallel.retain == serial.retain
+    assert parallel.hasher.keygen == serial.hasher.keygen == 2 ** 7 - 1
+    try:
+        keygen_state(BDSState(6, 2, OffsetHasher(64)), 2, processes=2)
+        assert False
+    except ValueError:
+        pass
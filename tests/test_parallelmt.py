@@ -0,0 +1,87 @@
+from common import recursive_hash, compute_root
+from parallelmt import ParallelMTBDSState
+
+
+def test_parallel_mt_state_traversal():
+    H, K, D = 4, 2, 3
+    correct_root = recursive_hash(H)
+    states = ParallelMTBDSState(H, K, D, processes=2)
+    states.keygen_and_setup()
+    for s in range(2 ** (D*H)):
+        for i, path in enumerate(states.authpaths()):
+            idx = (s >> (H*i)) & ((1 << H) - 1)
+            assert compute_root(H, idx, path) == correct_root
+        if s + 1 < 2 ** (D*H):
+            states.traverse(s)
+    states.close()
+
+
+def test_parallel_mt_state_snapshot():
+    from snapshot import dumps, loads
+    from sharding import split_mt
+    H, K, D = 4, 2, 2
+    correct_root = recursive_hash(H)
+    states = ParallelMTBDSState(H, K, D, processes=2)
+    states.keygen_and_setup()
+    for s in range(2 ** (D*H) - 1):
+        if s % 7 == 0:
+            restored, leaf = loads(dumps(states, s))
+            assert type(restored) is ParallelMTBDSState and leaf == s
+            assert dumps(restored, s) == dumps(states, s)
+            states.close()
+            states = restored
+        states.traverse(s)
+        for i, path in enumerate(states.authpaths()):
+            idx = ((s + 1) >> (H*i)) & ((1 << H) - 1)
+            assert compute_root(H, idx, path) == correct_root
+    states = ParallelMTBDSState(H, K, D, processes=0)
+    states.keygen_and_setup()
+    for shard in split_mt(states, 3):
+        for _ in range(shard.start, shard.stop):
+            leaf, paths = shard.sign()
+            for i, path in enumerate(paths):
+                idx = (leaf >> (H*i)) & ((1 << H) - 1)
+                assert compute_root(H, idx, path) == correct_root
+
+
+def test_parallel_mt_state_hasher():
+    from wots import WOTSLeaves
+    from bdstraversal_mt_c_like import BDSState
+    H, K, D = 4, 2, 2
+    leaves = WOTSLeaves(b'seed', 4)
+    root = BDSState(H, K, leaves).keygen_and_setup().v
+    states = ParallelMTBDSState(H, K, D, leaves, processes=0)
+    states.keygen_and_setup()
+    for s in range(2 ** (D*H) - 1):
+        states.traverse(s)
+        for i, path in enumerate(states.authpaths()):
+            idx = ((s + 1) >> (H*i)) & ((1 << H) - 1)
+            assert compute_root(H, idx, path, hasher=leaves) == root
+    try:
+        ParallelMTBDSState(H, K, D, leaves, processes=1)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_parallel_mt_state_seek():
+    from snapshot import dumps
+    H, K, D = 4, 2, 2
+    states = ParallelMTBDSState(H, K, D, processes=0)
+    states.keygen_and_setup()
+    stepped = []
+    for s in range(2 ** (D*H)):
+        stepped.append((dumps(states.currstates[0], 0),
+                        [list(auth) for auth in states.authpaths()]))
+        if s + 1 < 2 ** (D*H):
+            states.traverse(s)
+    for s in [0, 15, 16, 17, 75, 2 ** (D*H) - 1]:
+        states = ParallelMTBDSState(H, K, D, processes=0)
+        states.keygen_and_setup()
+        states.seek(s)
+        assert dumps(states.currstates[0], 0) == stepped[s][0]
+        for t in range(s, 2 ** (D*H) - 1):
+            assert [list(auth) for auth in states.authpaths()] == \
+                stepped[t][1]
+            states.traverse(t)
@@ -0,0 +1,37 @@
+import pickle
+from common import recursive_hash, compute_root
+from bdstraversal_mt_c_like import MTBDSState
+from sharding import split, split_mt
+
+
+def test_split():
+    H, K = 7, 3
+    correct_root = recursive_hash(H)
+    root, shards = split(H, K, 4, processes=2)
+    assert root.v == correct_root
+    leaves = []
+    for shard in shards:
+        for _ in range(shard.start, shard.stop):
+            if len(leaves) % 5 == 0:
+                shard = pickle.loads(pickle.dumps(shard))
+            leaf, path = shard.sign()
+            assert compute_root(H, leaf, path) == correct_root
+            leaves.append(leaf)
+    assert leaves == list(range(2 ** H))
+
+
+def test_split_mt():
+    H, K, D = 4, 2, 2
+    correct_root = recursive_hash(H)
+    states = MTBDSState(H, K, D)
+    states.keygen_and_setup()
+    leaves = []
+    for shard in split_mt(states, 3):
+        shard = pickle.loads(pickle.dumps(shard))
+        for _ in range(shard.start, shard.stop):
+            leaf, paths = shard.sign()
+            for i, path in enumerate(paths):
+                idx = (leaf >> (H*i)) & ((1 << H) - 1)
+                assert compute_root(H, idx, path) == correct_root
+            leaves.append(leaf)
+    assert leaves == list(range(2 ** (D*H)))
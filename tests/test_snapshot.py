@@ -0,0 +1,78 @@
+import os
+import tempfile
+from common import recursive_hash, compute_root
+from bdstraversal_mt_c_like import BDSState, MTBDSState, H, D
+from snapshot import dumps, loads, load, PersistentState
+
+
+def test_state_roundtrip():
+    correct_root = recursive_hash(H)
+    state = BDSState()
+    state.keygen_and_setup()
+    for s in range(2 ** H - 1):
+        restored, leaf = loads(dumps(state, s))
+        assert leaf == s
+        assert dumps(restored, s) == dumps(state, s)
+        state = restored
+        auth = state.traverse_and_update(s)
+        assert compute_root(H, s + 1, auth) == correct_root
+
+
+def test_restored_traversal():
+    # continue from a restored state at every step, so that the low heights
+    # of treehash instances with nodes buried in the stack are restored too
+    for h, k in [(8, 2), (10, 4)]:
+        correct_root = recursive_hash(h)
+        state = BDSState(h, k)
+        state.keygen_and_setup()
+        for s in range(2 ** h - 1):
+            state, _ = loads(dumps(state, s))
+            state.traverse_and_update(s)
+            assert compute_root(h, s + 1, state.auth) == correct_root
+
+
+def test_mt_state_roundtrip():
+    correct_root = recursive_hash(H)
+    states = MTBDSState()
+    states.keygen_and_setup()
+    for s in range(2 ** (D*H) - 1):
+        if s % 7 == 0:
+            states, _ = loads(dumps(states, s))
+        states.traverse(s)
+        for i, path in enumerate(states.authpaths()):
+            idx = ((s + 1) >> (H*i)) & ((1 << H) - 1)
+            assert compute_root(H, idx, path) == correct_root
+
+
+def test_persistent_state():
+    path = os.path.join(tempfile.mkdtemp(), 'state')
+    correct_root = recursive_hash(H)
+    state = BDSState()
+    state.keygen_and_setup()
+    signer = PersistentState(path, state)
+    for s in range(2 ** H):
+        leaf, auth = signer.authpath()
+        assert leaf == s and compute_root(H, leaf, auth) == correct_root
+        assert load(path)[1] == s + 1
+        signer = PersistentState.resume(path)
+    try:
+        signer.authpath()
+        assert False
+    except ValueError:
+        pass
+
+
+def test_snapshot_hash_function():
+    import common
+    state = BDSState()
+    state.keygen_and_setup()
+    snapshot = dumps(state, 0)
+    try:
+        common.use_hash('sha512', 32)
+        loads(snapshot)
+        assert False
+    except ValueError:
+        pass
+    finally:
+        common.use_hash('sha256')
+    assert dumps(loads(snapshot)[0], 0) == snapshot
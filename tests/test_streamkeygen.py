@@ -0,0 +1,68 @@
+import os
+import tempfile
+from itertools import islice
+from common import leafcalc, recursive_hash, compute_root
+from bdstraversal_mt_c_like import BDSState
+from streamkeygen import chunks, file_leaves, stream_keygen, resume
+
+
+def test_stream_keygen():
+    H, K = 6, 2
+    reference = BDSState(H, K)
+    reference.keygen_and_setup()
+    state = BDSState(H, K)
+    leaves = (leafcalc(j) for j in range(1 << H))
+    root = stream_keygen(state, chunks(leaves, 5))
+    assert root.v == recursive_hash(H)
+    assert state.auth == reference.auth
+    assert state.retain == reference.retain
+    for s in range((1 << H) - 1):
+        reference.traverse_and_update(s)
+        assert state.traverse_and_update(s) == reference.auth
+        assert compute_root(H, s + 1, state.auth) == root.v
+
+
+def test_stream_keygen_resume():
+    H, K = 6, 2
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'leaves')
+    checkpoint = os.path.join(directory, 'checkpoint')
+    with open(path, 'wb') as f:
+        for j in range(1 << H):
+            f.write(leafcalc(j))
+    state = BDSState(H, K)
+    try:
+        stream_keygen(state, islice(file_leaves(path, size=7), 3), checkpoint)
+        assert False
+    except ValueError:
+        pass
+    state = resume(checkpoint)
+    assert state.nextidx == 21
+    root = stream_keygen(state, file_leaves(path, state.nextidx, 7))
+    assert root.v == recursive_hash(H)
+    for s in range((1 << H) - 1):
+        state.traverse_and_update(s)
+        assert compute_root(H, s + 1, state.auth) == root.v
+
+
+def test_stream_keygen_file_leaves():
+    from hashlib import sha256
+    from streamkeygen import FileLeaves
+    H, K = 6, 2
+    path = os.path.join(tempfile.mkdtemp(), 'leaves')
+    with open(path, 'wb') as f:
+        for j in range(1 << H):
+            f.write(sha256(b'ext%d' % j).digest())
+    try:
+        stream_keygen(BDSState(H, K), file_leaves(path, size=8))
+        assert False
+    except ValueError:
+        pass
+    leaves = FileLeaves(path)
+    state = BDSState(H, K, leaves)
+    root = stream_keygen(state, file_leaves(path, size=8))
+    assert root.v != recursive_hash(H)
+    for s in range((1 << H) - 1):
+        state.traverse_and_update(s)
+        assert compute_root(H, s + 1, state.auth, hasher=leaves) == root.v
+    leaves.close()
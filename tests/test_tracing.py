@@ -0,0 +1,38 @@
+import os
+import json
+import tempfile
+from common import CostCounter
+from benchsuite import ENGINES, MT_ENGINE, steps
+from parallelmt import ParallelMTBDSState
+from tracing import Tracer, heights, load
+
+PARALLEL_ENGINE = ('ParallelMTBDSState', lambda H, K, D, hasher:
+                   ParallelMTBDSState(H, K, D, hasher, processes=0))
+
+
+def test_tracer():
+    for name, factory in ENGINES + [MT_ENGINE, PARALLEL_ENGINE]:
+        H, K, D = (4, 2, 2) if 'MTBDSState' in name else (6, 2, 1)
+        counter = CostCounter()
+        tracer = Tracer(counter)
+        state = tracer.attach(factory(H, K, D, tracer))
+        state.keygen_and_setup()
+        step, count = steps(state, H, D)
+        for s in range(count):
+            step(s)
+        assert [t.s for t in tracer.steps] == list(range(count))
+        assert sum(t.leaves + t.nodes for t in tracer.steps) == (
+            counter.leaves + counter.nodes - counter.keygen)
+        for t, site in zip(tracer.steps, tracer.sites):
+            assert not (t.s >> t.tau) & 1 and (t.s + 1) >> t.tau & 1
+            assert sum(site.values()) == t.leaves + t.nodes
+        if name in ('bds', 'bds_c_like', 'BDSState', 'compact BDSState'):
+            assert all(max(heights(t.updated) or [0]) < H - K
+                       for t in tracer.steps)
+    directory = tempfile.mkdtemp()
+    tracer.save(os.path.join(directory, 'trace.bin'))
+    assert load(os.path.join(directory, 'trace.bin')) == tracer.steps
+    tracer.chrome(os.path.join(directory, 'trace.json'))
+    with open(os.path.join(directory, 'trace.json')) as f:
+        events = json.load(f)['traceEvents']
+    assert len(events) == len(tracer.steps)
@@ -0,0 +1,49 @@
+from common import compute_root
+from bdstraversal_mt_c_like import BDSState, upcoming
+from wots import WOTSLeaves, Lookahead
+
+
+class Recorder(WOTSLeaves):
+
+    def __init__(self, *args):
+        super(Recorder, self).__init__(*args)
+        self.requested = []
+
+    def leafcalc(self, j):
+        self.requested.append(j)
+        return super(Recorder, self).leafcalc(j)
+
+
+def test_wots_leaves():
+    leaves = WOTSLeaves(b'seed', 16)
+    assert leaves.len == 67
+    assert leaves.leafcalc(5) == WOTSLeaves(b'seed', 16).leafcalc(5)
+    assert leaves.leafcalc(5) != WOTSLeaves(b'other', 16).leafcalc(5)
+
+
+def test_upcoming():
+    H, K, steps = 6, 2, 5
+    leaves = Recorder(b'seed', 4)
+    state = BDSState(H, K, leaves)
+    state.keygen_and_setup()
+    for s in range(2 ** H - 1):
+        if s % steps == 0:
+            expected = set(upcoming(state, s, steps))
+            leaves.requested = []
+        state.traverse_and_update(s)
+        assert set(leaves.requested) <= expected
+
+
+def test_lookahead():
+    H, K, steps = 5, 3, 4
+    leaves = WOTSLeaves(b'seed', 4)
+    lookahead = Lookahead(leaves, processes=2)
+    lookahead.prefetch(range(2 ** H))
+    state = BDSState(H, K, lookahead)
+    root = state.keygen_and_setup()
+    for s in range(2 ** H - 1):
+        if s % steps == 0:
+            lookahead.prefetch(upcoming(state, s, steps))
+        auth = state.traverse_and_update(s)
+        assert compute_root(H, s + 1, auth, hasher=leaves) == root.v
+    lookahead.close()
@@ -0,0 +1,180 @@
+#! /usr/bin/env python
+
+import sys
+import json
+import time
+import struct
+import tempfile
+from collections import namedtuple
+import common
+import bdstraversal_c_like
+
+# A trace file consists of a header, followed by one record per step. The
+# treehash instances that were updated during a step are stored as a mask of
+# their heights.
+MAGIC = b'MTTR'
+VERSION = 1
+HEADER = struct.Struct('<4sBQ')  # magic, version, number of steps
+STEP = struct.Struct('<QBddIIIQ')
+
+Step = namedtuple('Step', ['s', 'tau', 'start', 'duration', 'leaves',
+                           'nodes', 'depth', 'updated'])
+
+
+def stack_depth(state):
+    """Returns the number of nodes on the stack(s) of any traversal state."""
+    if hasattr(state, 'currstates'):
+        states = state.currstates + getattr(state, 'nextstates', [])
+        return sum(stack_depth(s) for s in states)
+    if hasattr(state, 'stacksize'):
+        return state.stacksize
+    if hasattr(state, 'stack'):
+        return len(state.stack)
+    instances = getattr(state, 'treehash', None) or getattr(state, 'desire')
+    return sum(len(th.stack) for th in instances if th is not None)
+
+
+class Tracer(object):
+    """Can be used as a hasher by a traversal instance, to record every step
+    that it takes through traverse, once it has been attached to the state:
+    tau, the wall time, the leaf and inner node hashes, the stack depth at
+    the end of the step, and the treehash instances that were updated. Each
+    hash is also counted under the code that asked for it, e.g. a treehash
+    update or the AUTH[tau] computation in traverse. The engines are not
+    changed, so tracing costs nothing for a state that is not attached.
+    Other hasher calls are passed on to hasher; a Tracer must be the hasher
+    that the state calls directly."""
+
+    def __init__(self, hasher=None):
+        self.hasher = common if hasher is None else hasher
+        self.state = None
+        self.steps = []
+        self.sites = []  # hashes per site, for every step
+        self.epoch = time.perf_counter()
+        self.begin(None)
+
+    def attach(self, state):
+        """Wraps traverse of state, so that its steps are recorded."""
+        traverse = state.traverse
+
+        def traced(s):
+            if self.s is None:
+                self.begin(s)
+            return traverse(s)
+        state.traverse = traced
+        self.state = state
+        return state
+
+    def begin(self, s):
+        self.s = s
+        self.leaves = 0
+        self.nodes = 0
+        self.updated = 0
+        self.site = {}
+        self.start = time.perf_counter()
+
+    def count(self):
+        frame = sys._getframe(2)  # the caller of leafcalc or g
+        obj = frame.f_locals.get('self')
+        name = frame.f_code.co_name
+        if type(obj).__name__ == 'Treehash':
+            self.updated |= 1 << obj.h
+            name = 'Treehash[{}].{}'.format(obj.h, name)
+        elif obj is not None:
+            name = '{}.{}'.format(type(obj).__name__, name)
+        self.site[name] = self.site.get(name, 0) + 1
+
+    def leafcalc(self, j):
+        self.leaves += 1
+        self.count()
+        return self.hasher.leafcalc(j)
+
+    def g(self, v):
+        self.nodes += 1
+        self.count()
+        return self.hasher.g(v)
+
+    def step(self, keygen=False):
+        self.hasher.step(keygen)
+        if not keygen and self.s is not None:
+            end = time.perf_counter()
+            s = self.s
+            tau = next(h for h in range(s.bit_length() + 1)
+                       if not (s >> h) & 1)
+            self.steps.append(Step(s, tau, self.start - self.epoch,
+                                   end - self.start, self.leaves, self.nodes,
+                                   stack_depth(self.state), self.updated))
+            self.sites.append(self.site)
+        self.begin(None)
+
+    def slowest(self, n=10):
+        """Returns the n slowest steps, with the hashes per site."""
+        order = sorted(range(len(self.steps)),
+                       key=lambda i: self.steps[i].duration, reverse=True)
+        return [(self.steps[i], self.sites[i]) for i in order[:n]]
+
+    def chrome(self, path):
+        """Writes the steps as a trace that chrome://tracing or Perfetto can
+        open, with one complete event per step."""
+        events = []
+        for step, site in zip(self.steps, self.sites):
+            args = dict(step._asdict(), updated=heights(step.updated))
+            del args['start'], args['duration']
+            args.update(site)
+            events.append({'name': 'traverse({})'.format(step.s), 'ph': 'X',
+                           'cat': 'tau{}'.format(step.tau), 'pid': 0,
+                           'tid': 0, 'ts': step.start * 1e6,
+                           'dur': step.duration * 1e6, 'args': args})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ns'}, f)
+
+    def save(self, path):
+        """Writes the steps to a compact binary trace file."""
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.steps)))
+            for step in self.steps:
+                f.write(STEP.pack(*step))
+
+
+def heights(mask):
+    return [h for h in range(mask.bit_length()) if (mask >> h) & 1]
+
+
+def load(path):
+    """Reads the steps from a binary trace file."""
+    with open(path, 'rb') as f:
+        buf = f.read()
+    magic, version, count = HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a trace file")
+    return [Step._make(STEP.unpack_from(buf, HEADER.size + i * STEP.size))
+            for i in range(count)]
+
+
+if __name__ == "__main__":
+    H, K = 10, 4
+    state = bdstraversal_c_like.BDSState(H, K)
+    state.keygen_and_setup()
+    start = time.time()
+    for s in range((1 << H) - 1):
+        state.traverse(s)
+    plain = time.time() - start
+    tracer = Tracer()
+    state = tracer.attach(bdstraversal_c_like.BDSState(H, K, tracer))
+    state.keygen_and_setup()
+    start = time.time()
+    for s in range((1 << H) - 1):
+        state.traverse(s)
+    traced = time.time() - start
+    print('{:.1f}us per step, {:.1f}us traced'.format(
+        plain / ((1 << H) - 1) * 1e6, traced / ((1 << H) - 1) * 1e6))
+    for step, site in tracer.slowest(5):
+        print('traverse({}): tau {}, {:.1f}us, {} hashes, updated {}: '
+              '{}'.format(step.s, step.tau, step.duration * 1e6,
+                          step.leaves + step.nodes, heights(step.updated),
+                          site))
+    directory = tempfile.mkdtemp()
+    tracer.chrome(directory + '/trace.json')
+    tracer.save(directory + '/trace.bin')
+    assert load(directory + '/trace.bin') == tracer.steps
+    print('traces written to {}'.format(directory))
@@ -0,0 +1,134 @@
+#! /usr/bin/env python
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+import common
+from common import percentile
+from bdstraversal_mt_c_like import BDSState, upcoming
+
+
+def xor(a, b):
+    return bytes(x ^ y for x, y in zip(a, b))
+
+
+class WOTSLeaves(object):
+    """Hasher whose leaves are WOTS+ public keys, compressed with an L-tree
+    as in XMSS. Every leaf costs about len * w hashes, rather than one. Node
+    hashes and chain steps go through hasher.g, so a CostCounter counts
+    them all as inner node hashes."""
+
+    def __init__(self, seed=b'', w=16, hasher=common):
+        n = common.N
+        logw = w.bit_length() - 1
+        assert w == 1 << logw
+        self.seed = seed
+        self.w = w
+        self.hasher = hasher
+        self.len1 = -(-8 * n // logw)
+        self.len2 = ((self.len1 * (w - 1)).bit_length() - 1) // logw + 1
+        self.len = self.len1 + self.len2
+        self.masks = [self.prf(b'mask', i) for i in range(w - 1)]
+        self.ltree_masks = [self.prf(b'ltree', i) for i in range(2)]
+
+    def prf(self, domain, *values):
+        data = self.seed + domain + b''.join(v.to_bytes(4, 'big')
+                                             for v in values)
+        return common.hashfn(data)
+
+    def chain(self, x, start, steps):
+        for k in range(start, start + steps):
+            x = self.hasher.g(xor(x, self.masks[k]))
+        return x
+
+    def ltree(self, nodes):
+        m0, m1 = self.ltree_masks
+        while len(nodes) > 1:
+            parents = [self.hasher.g(xor(nodes[i], m0) + xor(nodes[i + 1], m1))
+                       for i in range(0, len(nodes) - 1, 2)]
+            if len(nodes) & 1:  # the last node is lifted to the next level
+                parents.append(nodes[-1])
+            nodes = parents
+        return nodes[0]
+
+    def leafcalc(self, j):
+        pk = [self.chain(self.prf(b'sk', j, i), 0, self.w - 1)
+              for i in range(self.len)]
+        return self.ltree(pk)
+
+    def g(self, v):
+        return self.hasher.g(v)
+
+    def step(self, keygen=False):
+        self.hasher.step(keygen)
+
+
+def compute_leaves(args):
+    seed, w, indices = args
+    leaves = WOTSLeaves(seed, w)
+    return [leaves.leafcalc(j) for j in indices]
+
+
+class Lookahead(object):
+    """Hasher that serves the leaves of a WOTSLeaves from a process pool,
+    once they have been requested with prefetch. Other leaves are computed
+    in place, as they would be without it."""
+
+    def __init__(self, leaves, processes=None, chunk=8):
+        self.leaves = leaves
+        self.pool = ProcessPoolExecutor(processes, **common.pool_options())
+        self.chunk = chunk
+        self.pending = {}
+        self.ready = {}
+
+    def prefetch(self, indices):
+        indices = [j for j in indices
+                   if j not in self.pending and j not in self.ready]
+        for i in range(0, len(indices), self.chunk):
+            chunk = indices[i:i + self.chunk]
+            future = self.pool.submit(compute_leaves, (
+                self.leaves.seed, self.leaves.w, chunk))
+            for j in chunk:
+                self.pending[j] = (future, chunk)
+
+    def leafcalc(self, j):
+        if j in self.pending:
+            future, chunk = self.pending[j]
+            for idx, v in zip(chunk, future.result()):
+                del self.pending[idx]
+                self.ready[idx] = v
+        if j in self.ready:
+            return self.ready.pop(j)
+        return self.leaves.leafcalc(j)
+
+    def g(self, v):
+        return self.leaves.g(v)
+
+    def step(self, keygen=False):
+        self.leaves.step(keygen)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+if __name__ == "__main__":
+    H, K, steps = 8, 2, 16
+    leaves = WOTSLeaves(b'seed')
+    for name, hasher in [('inline', leaves), ('lookahead', Lookahead(leaves))]:
+        state = BDSState(H, K, hasher)
+        start = time.time()
+        if hasher is not leaves:
+            hasher.prefetch(range(1 << H))
+        root = state.keygen_and_setup()
+        keygen = time.time() - start
+        latencies = []
+        for s in range((1 << H) - 1):
+            if hasher is not leaves and s % steps == 0:
+                hasher.prefetch(upcoming(state, s, 2 * steps))
+            start = time.perf_counter()
+            state.traverse_and_update(s)
+            latencies.append(time.perf_counter() - start)
+        print('{}: keygen {:.2f}s, p50 {:.2f}ms, p99 {:.2f}ms per step'.format(
+            name, keygen, percentile(latencies, 50) * 1e3,
+            percentile(latencies, 99) * 1e3))
+        if hasher is not leaves:
+            hasher.close()